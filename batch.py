@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""Run demstats, ktx-stats or gen-extra over many demos using a pool of worker processes.
+
+Demos are given as files, directories (searched recursively) or glob patterns.
+Each worker process imports the tool once and then handles many demos, so the
+interpreter start-up and fragfile parsing are paid per worker rather than per
+demo.
+
+Results are cached on disk, keyed by a hash of each demo's contents and of the
+extractor's sources (and fragfile), so re-running over an archive only
+processes new or changed demos.  Pass `--force` to process every demo again.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import sys
+
+try:
+    from . import demstats
+    from . import resultcache
+except ImportError:
+    import demstats
+    import resultcache
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Demo file suffixes each tool accepts, when searching directories.
+SUFFIXES = {
+    "demstats": (".dem", ".dem.gz"),
+    "ktx-stats": (".mvd", ".mvd.gz"),
+    "gen-extra": (".mvd", ".mvd.gz", ".dem", ".dem.gz"),
+}
+
+# Source files each tool's results depend on, for the result cache.
+SOURCES = {
+    "demstats": ("demstats.py", "proto.py", "jsonstream.py"),
+    "ktx-stats": ("ktx-stats.py", "mvd.py"),
+    "gen-extra": ("gen-extra.py", "vis2.py", "demstats.py", "proto.py", "jsonstream.py"),
+}
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ktxstats")
+
+
+def load_script(name):
+    """Import one of the hyphenated scripts alongside this file as a module."""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(HERE, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_demos(paths, suffixes):
+    """Return `(demo, subdir)` for each demo in `paths`.
+
+    `subdir` is the demo's directory relative to the directory it was found
+    in, to be mirrored under the output directory, or empty for demos given as
+    files or glob patterns.
+    """
+    demos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                subdir = "" if root == path else os.path.relpath(root, path)
+                demos.extend((os.path.join(root, f), subdir) for f in sorted(files) if f.endswith(suffixes))
+        elif os.path.exists(path):
+            demos.append((path, ""))
+        else:
+            demos.extend((demo, "") for demo in sorted(glob.glob(path, recursive=True)))
+    return demos
+
+
+def demo_name(demo):
+    name = os.path.basename(demo)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def check_outputs(demos):
+    """Drop demos listed more than once, and fail if different demos would write the same outputs."""
+    unique = []
+    seen = {}
+    for demo, subdir in demos:
+        name = os.path.join(subdir, demo_name(demo))
+        if name in seen:
+            if os.path.realpath(seen[name]) == os.path.realpath(demo):
+                continue
+            raise SystemExit(f"ERR: {seen[name]} and {demo} would both write results named {name}")
+        seen[name] = demo
+        unique.append((demo, subdir))
+    return unique
+
+
+def tool_version(tool, fragfile):
+    """Return a hash identifying the version of `tool`, so cached results are dropped when it changes."""
+    paths = [os.path.join(HERE, name) for name in SOURCES[tool]]
+    if tool == "demstats":
+        paths.append(fragfile)
+    elif tool == "gen-extra":
+        if os.path.exists(fragfile):
+            paths.append(fragfile)
+        mvdparser = shutil.which("mvdparser")
+        if mvdparser:
+            paths.append(mvdparser)
+    return resultcache.hash_files(paths)
+
+
+# Per-worker state, set up once by `init_worker`.
+_worker = {}
+
+
+def init_worker(tool, fragfile, cache=None, version=None, force=False):
+    _worker["tool"] = tool
+    _worker["fragfile"] = fragfile
+    _worker["cache"] = cache
+    _worker["version"] = version
+    _worker["force"] = force
+    if tool == "demstats":
+        _worker["stats"] = demstats.DemoStats(demstats.cached_fragfile(fragfile))
+    else:
+        _worker["module"] = load_script(tool)
+
+
+def run_demstats(demo, output_dir):
+    out = os.path.join(output_dir, demo_name(demo))
+    os.makedirs(out, exist_ok=True)
+    log_path = os.path.join(out, "demstats.log")
+    with open(log_path, "w") as log:
+        result = _worker["stats"].process(demo, out=log)
+    return out, result.write(out) + [log_path]
+
+
+def run_ktx_stats(demo, output_dir):
+    content = _worker["module"].extract(demo)
+    json.loads(content)
+    out = os.path.join(output_dir, demo_name(demo) + ".json")
+    with open(out, "wb") as fd:
+        fd.write(content)
+    return out, [out]
+
+
+def run_gen_extra(demo, output_dir):
+    events = None
+    if demo.endswith(SUFFIXES["demstats"]):
+        events = demstats.cached_fragfile(_worker["fragfile"])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        out = _worker["module"].generate(demo, output_dir, events=events)
+    return out, [out]
+
+
+RUNNERS = {
+    "demstats": run_demstats,
+    "ktx-stats": run_ktx_stats,
+    "gen-extra": run_gen_extra,
+}
+
+
+def run_job(demo, output_dir):
+    """Process one demo in a worker, returning `(demo, ok, detail)`.
+
+    Results are taken from the cache when possible, and stored in it otherwise.
+    """
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        cache = _worker["cache"]
+        key = None
+        if cache is not None:
+            key = cache.key(demo, _worker["version"], demo_name(demo))
+            if not _worker["force"]:
+                outputs = cache.get(key, output_dir)
+                if outputs is not None:
+                    return demo, True, f"{os.path.commonpath(outputs)} (cached)"
+
+        detail, outputs = RUNNERS[_worker["tool"]](demo, output_dir)
+
+        if key is not None:
+            cache.put(key, output_dir, outputs)
+        return demo, True, detail
+    except (Exception, SystemExit) as e:
+        return demo, False, f"{type(e).__name__}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("tool", choices=sorted(RUNNERS), help="extractor to run on each demo")
+    parser.add_argument("paths", nargs="+", help="demo files, directories or glob patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-o", "--output-dir", default="batch-output", help="directory to write results into")
+    parser.add_argument("--fragfile", default="fragfile.dat", help="fragfile used for NetQuake demos")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="directory of the result cache")
+    parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                        help="size the result cache is trimmed to after each run, 0 to disable it")
+    parser.add_argument("-f", "--force", action="store_true", help="process every demo, ignoring cached results")
+    args = parser.parse_args()
+
+    if args.tool == "demstats" and not os.path.exists(args.fragfile):
+        raise SystemExit(f"ERR: Fragfile {args.fragfile} not found")
+
+    demos = check_outputs(find_demos(args.paths, SUFFIXES[args.tool]))
+    if not demos:
+        raise SystemExit("ERR: No demos found")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    cache = version = None
+    if args.cache_size > 0:
+        cache = resultcache.ResultCache(args.cache_dir, args.cache_size << 20)
+        version = tool_version(args.tool, args.fragfile)
+
+    failures = []
+    with concurrent.futures.ProcessPoolExecutor(args.jobs, initializer=init_worker,
+                                                initargs=(args.tool, args.fragfile, cache, version,
+                                                          args.force)) as executor:
+        futures = [executor.submit(run_job, demo, os.path.join(args.output_dir, subdir)) for demo, subdir in demos]
+        for future in concurrent.futures.as_completed(futures):
+            demo, ok, detail = future.result()
+            if ok:
+                print("success", demo, "->", detail)
+            else:
+                print("failed", demo, detail)
+                failures.append(demo)
+
+    if cache is not None:
+        cache.evict()
+
+    print(f"{len(demos) - len(failures)} succeeded, {len(failures)} failed, {len(demos)} total")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Microbenchmark for proto.py: messages parsed per second, for each message type.
+
+Pass `--against path/to/other/proto.py` (for example a checkout of an older
+revision) to print its numbers alongside for a before/after comparison.
+"""
+import argparse
+import importlib.util
+import os
+import struct
+import sys
+import time
+
+
+def _coords(*xs):
+    return struct.pack(f"<{len(xs)}h", *(int(x * 8) for x in xs))
+
+
+SAMPLES = [
+    ("TIME", bytes([7]) + struct.pack("<f", 123.5)),
+    ("UPDATEFRAGS", bytes([14]) + struct.pack("<BH", 3, 17)),
+    ("UPDATECOLORS", bytes([17, 3, 0x4d])),
+    ("UPDATESTAT", bytes([3]) + struct.pack("<BI", 3, 1234)),
+    ("CDTRACK", bytes([32, 2, 2])),
+    ("SETVIEW", bytes([5]) + struct.pack("<H", 1)),
+    ("SIGNONNUM", bytes([25, 2])),
+    ("SETPAUSE", bytes([24, 0])),
+    ("NOP", bytes([1])),
+    ("PRINT", bytes([8]) + b"Player rides ken's rocket\n\0"),
+    ("UPDATENAME", bytes([13, 3]) + b"Player\0"),
+    ("LIGHTSTYLE", bytes([12, 3]) + b"mmnmmommommnonmmonqnmmo\0"),
+    ("SETANGLE", bytes([10, 1, 2, 3])),
+    ("DAMAGE", bytes([19, 3, 4]) + _coords(10, 20, 30)),
+    ("PARTICLE", bytes([18]) + _coords(10, 20, 30) + struct.pack("<bbbBB", 1, -2, 3, 8, 73)),
+    ("SOUND", bytes([6, 3, 200, 64]) + struct.pack("<HB", (5 << 3) | 1, 7) + _coords(10, 20, 30)),
+    ("TEMP_ENTITY", bytes([23, 3]) + _coords(10, 20, 30)),
+    ("TEMP_ENTITY beam", bytes([23, 5]) + struct.pack("<H", 5) + _coords(10, 20, 30) + _coords(40, 50, 60)),
+    ("SPAWNBASELINE", bytes([22]) + struct.pack("<HBBBB", 5, 1, 2, 3, 4) +
+                      b"".join(_coords(x) + bytes([x]) for x in (10, 20, 30))),
+    ("SPAWNSTATIC", bytes([20]) + struct.pack("<BBBB", 1, 2, 3, 4) +
+                    b"".join(_coords(x) + bytes([x]) for x in (10, 20, 30))),
+    ("SPAWNSTATICSOUND", bytes([29]) + _coords(10, 20, 30) + bytes([1, 2, 3])),
+    ("CLIENTDATA", bytes([15]) + struct.pack("<H", (1 << 0) | (1 << 5) | (1 << 10) | (1 << 13) | (1 << 14)) +
+                   bytes([22, 3]) + struct.pack("<I", 4194304 | 32) + bytes([100, 6]) +
+                   struct.pack("<HBBBBBB", 100, 25, 25, 100, 25, 50, 32)),
+    ("UPDATE", bytes([0x80 | 1 | 2 | 4 | 8 | 64, (1 << 2) | (1 << 4)]) + bytes([17]) + bytes([3, 1, 5]) +
+               _coords(10) + _coords(20) + _coords(30)),
+]
+
+
+def load_proto(path):
+    spec = importlib.util.spec_from_file_location(f"_bench_proto_{abs(hash(path))}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_parser(proto, name, msg):
+    protocol = proto.Protocol(proto.ProtocolVersion.NETQUAKE, proto.ProtocolFlags(0))
+    server_message = proto.ServerMessage
+
+    if hasattr(server_message, "parse_message_from"):
+        parse = lambda: server_message.parse_message_from(msg, 0, protocol)
+    else:
+        parse = lambda: server_message.parse_message(msg, protocol)
+
+    parsed, _ = parse()
+    assert parsed is not None, name
+    return parse
+
+
+def bench(parsers, number, repeat):
+    """Return the best messages/second of each parser, timing them in turn to even out noise."""
+    best = [float("inf")] * len(parsers)
+    for _ in range(repeat):
+        for i, parse in enumerate(parsers):
+            start = time.perf_counter()
+            for _ in range(number):
+                parse()
+            best[i] = min(best[i], time.perf_counter() - start)
+    return [number / t for t in best]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--against", metavar="PROTO_PY", help="other proto.py to compare with")
+    parser.add_argument("-n", "--number", type=int, default=10000, help="messages per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=9, help="timing runs per message type")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    modules = [load_proto(os.path.join(here, "proto.py"))]
+    if args.against:
+        modules.insert(0, load_proto(args.against))
+        print(f"{'message':<20} {'before msg/s':>14} {'after msg/s':>14} {'speedup':>8}")
+    else:
+        print(f"{'message':<20} {'msg/s':>14}")
+
+    for name, msg in SAMPLES:
+        rates = bench([make_parser(proto, name, msg) for proto in modules], args.number, args.repeat)
+        if args.against:
+            before, after = rates
+            print(f"{name:<20} {before:>14,.0f} {after:>14,.0f} {after / before:>7.2f}x")
+        else:
+            print(f"{name:<20} {rates[0]:>14,.0f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
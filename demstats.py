@@ -1,14 +1,23 @@
 from collections import defaultdict
 from dataclasses import dataclass, field
 from typing import Dict, List
+import argparse
+import array
+import contextlib
 import datetime
+import functools
 import json
 import logging
-import pathlib
+import os
 import re
 import sys
 
-from . import proto
+try:
+    from . import jsonstream
+    from . import proto
+except ImportError:
+    import jsonstream
+    import proto
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +36,75 @@ class Player:
     bottom_color: int = 0
 
 
+class EventLog:
+    """A log of events stored column by column, in typed arrays.
+
+    Iterating it yields each event as a tuple of its column values.
+    """
+
+    def __init__(self, columns):
+        self._columns = {name: array.array(typecode) for name, typecode in columns}
+        self._appends = [column.append for column in self._columns.values()]
+
+    def append(self, event):
+        for append, value in zip(self._appends, event):
+            append(value)
+
+    @property
+    def names(self):
+        return tuple(self._columns)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def to_dict(self):
+        """Return the columns as lists, by name, for JSON."""
+        return {name: column.tolist() for name, column in self._columns.items()}
+
+    def to_numpy(self):
+        """Return the columns as NumPy arrays, by name."""
+        import numpy
+        return {name: numpy.array(column, dtype=column.typecode) for name, column in self._columns.items()}
+
+    def to_arrow(self):
+        """Return the log as a PyArrow table, which can be written out as Parquet."""
+        import pyarrow
+        types = {"d": pyarrow.float64(), "i": pyarrow.int32()}
+        return pyarrow.table({
+            name: pyarrow.Array.from_buffers(types[column.typecode], len(column),
+                                             [None, pyarrow.py_buffer(column.tobytes())])
+            for name, column in self._columns.items()
+        })
+
+    def __iter__(self):
+        return zip(*self._columns.values())
+
+    def __len__(self):
+        return len(next(iter(self._columns.values()), ()))
+
+
+FRAG_COLUMNS = (
+    ("time", "d"),
+    ("client_num", "i"),
+    ("frags", "i"),
+    ("deaths", "i"),
+)
+
+ITEM_COLUMNS = (
+    ("time", "d"),
+    ("client_num", "i"),
+    ("quad_count", "i"),
+    ("pent_count", "i"),
+    ("ctf_pickups", "i"),
+    ("ctf_caps", "i"),
+)
+
+
 @dataclass
 class State:
     players: Dict[int, Player] = field(default_factory=dict)
     players_by_name: Dict[str, Player] = field(default_factory=dict)
-    time: int = 0
+    time: float = 0.0
     duration: int = 0
     map_name: str = ""
     msg_buffer: List[str] = field(default_factory=list)
@@ -39,8 +112,11 @@ class State:
     last_quad_time: int = 0
     last_quad_player: Player = None
 
-    frags: list = field(default_factory=list)
-    items: list = field(default_factory=list)
+    frags: EventLog = field(default_factory=lambda: EventLog(FRAG_COLUMNS))
+    items: EventLog = field(default_factory=lambda: EventLog(ITEM_COLUMNS))
+
+    # Optional writer that each event is also sent to as it is logged.
+    stream: jsonstream.LinesWriter = None
 
     def set_player_name(self, client_num, name):
         player = self.players.get(client_num)
@@ -53,23 +129,83 @@ class State:
         self.players_by_name[player.raw_name] = player
         return player
 
+    def scoreboard(self):
+        """Return the frags and CTF points of each player, the team scores and who has the quad.
+
+        The time is left out, so scoreboards compare equal while the score is unchanged.
+        """
+        players = []
+        teams = defaultdict(int)
+        for player in self.players.values():
+            if player.spectator:
+                continue
+            players.append({
+                "player_id": player.client_num,
+                "name": player.raw_name,
+                "team": player.team,
+                "frags": player.frags,
+                "ctf-points": player.info.get("ctf-points", 0),
+                "ctf-caps": player.info.get("ctf-caps", 0),
+                "has-flag": player.has_flag > 0,
+            })
+            teams[player.team] += player.frags
+
+        quad = None
+        if self.last_quad_player is not None:
+            quad = {
+                "player_id": self.last_quad_player.client_num,
+                "since": self.last_quad_time,
+            }
+
+        return {"players": players, "teams": dict(teams), "quad": quad}
+
     def log_frags(self, player, suicide=False):
-        self.frags.append((
+        event = (
             self.time,
             player.client_num,
             player.frags if not suicide else player.frags - 1,
             player.info["deaths"]
-        ))
+        )
+        self.frags.append(event)
+        if self.stream is not None:
+            self.stream.write(dict(type="frag", **_frag_event(event, player)))
 
     def log_items(self, player):
-        self.items.append((
+        event = (
             self.time,
             player.client_num,
             player.info["quad_count"],
             player.info["pent_count"],
             player.info["ctf-pickups"],
             player.info["ctf-caps"],
-        ))
+        )
+        self.items.append(event)
+        if self.stream is not None:
+            self.stream.write(dict(type="item", **_item_event(event)))
+
+
+def _frag_event(event, player):
+    ts, client_num, frags, deaths = event
+    return {
+        "timestamp": ts,
+        "player_id": client_num,
+        "name": player.raw_name,
+        "team": player.team,
+        "frags": frags,
+        "deaths": deaths
+    }
+
+
+def _item_event(event):
+    ts, client_num, quads, pents, pickups, captures = event
+    return {
+        "timestamp": ts,
+        "player_id": client_num,
+        "quad": quads,
+        "pent": pents,
+        "flagtk": pickups,
+        "flagcap": captures
+    }
 
 def _format_time(seconds):
     frac = seconds * 1e5
@@ -88,48 +224,47 @@ def _format_time(seconds):
         out = f'{minutes}:{out}'
     return out
 
+# Replacements for the control characters of the Quake charset, which the
+# high-bit characters mirror.
+_FIX_TEXT_LOOKUP = {
+    0: "=",
+    2: "=",
+    5: "•",
+    10: " ",
+    14: "•",
+    15: "•",
+    16: "[",
+    17: "]",
+    18: "0",
+    19: "1",
+    20: "2",
+    21: "3",
+    22: "4",
+    23: "5",
+    24: "6",
+    25: "7",
+    26: "8",
+    27: "9",
+    28: "•",
+    29: "=",
+    30: "=",
+    31: "="
+}
+
+# Demo strings are decoded as Latin-1, so this covers every character in them.
+_FIX_TEXT_TABLE = {
+    c: chr(c & 0x7f) if c & 0x7f >= 32 else _FIX_TEXT_LOOKUP.get(c & 0x7f, '?')
+    for c in range(256)
+}
+
+
+@functools.lru_cache(maxsize=4096)
 def fix_text(n):
-    lookupTable = {
-        0: "=",
-        2: "=",
-        5: "•",
-        10: " ",
-        14: "•",
-        15: "•",
-        16: "[",
-        17: "]",
-        18: "0",
-        19: "1",
-        20: "2",
-        21: "3",
-        22: "4",
-        23: "5",
-        24: "6",
-        25: "7",
-        26: "8",
-        27: "9",
-        28: "•",
-        29: "=",
-        30: "=",
-        31: "="
-    }
-    return "".join(
-        map(
-            lambda c: chr(c) if c >= 32 else lookupTable.get(c, '?'),
-            map(
-                lambda c: c if c < 128 else c - 128,
-                map(ord, n)
-            )
-        )
-    )
+    return n.translate(_FIX_TEXT_TABLE)
 
 
-def demo_stats_entrypoint(events):
-    demo_path = pathlib.Path(sys.argv[1])
-
-    state = State()
-
-    ignored = set([
+# Messages demstats has no use for, which the parser skips without decoding.
+_IGNORED_MESSAGES = frozenset([
         proto.ServerMessageType.CDTRACK,
         proto.ServerMessageType.CENTERPRINT,
         proto.ServerMessageType.CLIENTDATA,
@@ -149,272 +284,416 @@ def demo_stats_entrypoint(events):
         proto.ServerMessageType.TEMP_ENTITY,
         proto.ServerMessageType.UPDATE,
         proto.ServerMessageType.UPDATESTAT,
-    ])
-
-    with demo_path.open('rb') as f:
-        for msg_end, view_angle, msg in proto.read_demo_file(f):
-            if msg.msg_type == proto.ServerMessageType.SERVERINFO:
-                state.map_name = msg.models[0].rsplit('/', 1)[1].split('.', 1)[0]
-                map_name = msg.level_name
-                print(state.map_name, map_name)
-            elif msg.msg_type == proto.ServerMessageType.TIME:
-                state.time = msg.time
-            elif msg.msg_type in (proto.ServerMessageType.INTERMISSION,
-                                  proto.ServerMessageType.FINALE):
-                if state.time > state.duration:
-                    state.duration = state.time
-            elif msg.msg_type == proto.ServerMessageType.UPDATENAME:
-                if not msg.name:
-                    continue
-                state.set_player_name(msg.client_num, msg.name)
-            elif msg.msg_type == proto.ServerMessageType.UPDATEFRAGS:
-                if msg.count != 0:
-                    # delta = msg.count - state.players[msg.client_num].frags
-                    # p0 = state.players[msg.client_num]
-                    # altsum = p0.info.get("ctf-points", 0) + p0.info.get("kills", 0) - p0.info.get("suicides", 0)
-                    # matches = "MATCHES" if altsum == msg.count else "DIFF %d" % (msg.count - altsum)
-                    # print(int(state.time), state.players[msg.client_num].name, msg.count, "alt:", altsum, "this delta:", delta, matches)
-                    state.players[msg.client_num].frags = msg.count
-                    state.log_frags(state.players[msg.client_num])
-            elif msg.msg_type == proto.ServerMessageType.UPDATECOLORS:
-                player = state.players.get(msg.client_num)
-                if not player:
-                    continue # non-client
-                player.top_color = (msg.color & 0xf0) >> 4
-                player.bottom_color = msg.color & 0x0f
-                if 4 in (player.top_color, player.bottom_color):
-                    player.team = "red"
-                elif 13 in (player.top_color, player.bottom_color):
-                    player.team = "blue"
-                else:
-                    player.spectator = True
-            elif msg.msg_type == proto.ServerMessageType.PRINT:
-                if ord(msg.string[0]) == 1:
-                    print("chat:", fix_text(msg.string[1:]))
-                    continue
-                elif ord(msg.string[0]) == 2:
-                    print("server:", fix_text(msg.string[1:]))
-                    continue
-
-                if msg.string[-1] == '\n':
-                    state.msg_buffer.append(msg.string[:-1])
-                    found = False
-                    for event in events:
-                        if event.apply(state, state.msg_buffer):
-                            found = True
-                            break
-                    if not found:
-                        logger.debug("NOT FOUND: '%s'", "".join(map(fix_text, state.msg_buffer)))
-                    state.msg_buffer.clear()
-                else:
-                    state.msg_buffer.append(msg.string)
-            elif msg.msg_type not in ignored:
-                print(msg.msg_type)
-
-    for p in sorted(state.players.values(), key=lambda x: x.frags, reverse=True):
-        if p.spectator:
-            continue
-        kills = p.info.get("kills", 0)
-        suicides = p.info.get("suicides", 0)
-        points = p.info.get("ctf-points", 0)
-        print(p.name, p.team, p.frags, "kills", kills, "ctf-points", points, "sum", kills + points - suicides, "delta", p.frags - (kills + points - suicides))
-        print(p.info)
-
-    frag_events = []
-    for player in state.players.values():
-        if player.spectator:
-            continue
-        frag_events.append({
-            "timestamp": 0,
-            "player_id": player.client_num,
-            "name": player.raw_name,
-            "team": player.team,
-            "frags": 0,
-            "deaths": 0
-        })
+])
 
-    for ts, client_num, frags, deaths in state.frags:
-        player = state.players[client_num]
-        frag_events.append({
-            "timestamp": ts,
-            "player_id": client_num,
-            "name": player.raw_name,
-            "team": player.team,
-            "frags": frags,
-            "deaths": deaths
-        })
+_WANTED_MESSAGES = frozenset(proto.ServerMessageType) - _IGNORED_MESSAGES
 
-    with open("frags.json", "w") as fd:
-        json.dump(frag_events, fd)
 
-    item_events = []
-    for player in state.players.values():
-        if player.spectator:
-            continue
-        item_events.append({
-            "timestamp": 0,
-            "player_id": player.client_num,
-            "quad": 0,
-            "pent": 0,
-            "flagtk": 0,
-            "flagcap": 0
-        })
+@dataclass
+class DemoStatsResult:
+    """The statistics gathered from one demo by `DemoStats.process`."""
+    state: State
 
-    for ts, client_num, quads, pents, pickups, captures in state.items:
-        item_events.append({
-            "timestamp": ts,
-            "player_id": client_num,
-            "quad": quads,
-            "pent": pents,
-            "flagtk": pickups,
-            "flagcap": captures
-        })
+    @property
+    def map_name(self):
+        return self.state.map_name
 
-    with open("items.json", "w") as fd:
-        json.dump(item_events, fd)
+    def frag_events(self):
+        """Iterate the frag events, as written to frags.json."""
+        state = self.state
+        for player in state.players.values():
+            if player.spectator:
+                continue
+            yield {
+                "timestamp": 0,
+                "player_id": player.client_num,
+                "name": player.raw_name,
+                "team": player.team,
+                "frags": 0,
+                "deaths": 0
+            }
 
-    players = []
-    for player in state.players.values():
-        if player.spectator:
-            continue
-        player_stats = {
-            "top-color": player.top_color,
-            "bottom-color": player.bottom_color,
-            "ping": 0,
-            "login": "",
-            "name": player.raw_name,
-            "team": player.team,
-            "client": "Quake 1.07",
-            "player_id": str(player.client_num),
-            "stats": {
-                "frags": player.frags,
-                "deaths": player.info["deaths"],
-                "tk": player.info["tkills"],
-                "spawn-frags": 0,
-                "kills": player.info["kills"],
-                "suicides": player.info["suicides"],
-            },
-            "dmg": {
-                "taken": 0,
-                "given": 0,
-                "team": 0,
-                "self": 0,
-                "team-weapons": 0,
-                "enemy-weapons": 0,
-                "taken-to-die": 0,
-            },
-            "xfer": 0,
-            "spree": {
-                "max": 0,
+        for event in state.frags:
+            yield _frag_event(event, state.players[event[1]])
+
+    def item_events(self):
+        """Iterate the item events, as written to items.json."""
+        state = self.state
+        for player in state.players.values():
+            if player.spectator:
+                continue
+            yield {
+                "timestamp": 0,
+                "player_id": player.client_num,
                 "quad": 0,
-            },
-            "control": 0,
-            "speed": {
-                "max": 0,
-                "avg": 0,
-            },
-            "weapons": {
-            },
-            "items": {
-                "health_15": {
-                    "took": 0,
-                },
-                "health_25": {
-                    "took": 0,
-                },
-                "health_100": {
-                    "took": 0,
-                },
-                "ga": {
-                    "took": 0,
+                "pent": 0,
+                "flagtk": 0,
+                "flagcap": 0
+            }
+
+        for event in state.items:
+            yield _item_event(event)
+
+    def frag_columns(self):
+        """Return the frag events as NumPy arrays by field, without building a dict per event."""
+        import numpy
+        state = self.state
+        players = [player for player in state.players.values() if not player.spectator]
+        logged = state.frags.to_numpy()
+
+        # Names and teams by client number, for looking up those of each event.
+        size = max(state.players, default=-1) + 1
+        names = numpy.empty(size, dtype=object)
+        teams = numpy.empty(size, dtype=object)
+        for player in state.players.values():
+            names[player.client_num] = player.raw_name
+            teams[player.client_num] = player.team
+
+        player_ids = numpy.concatenate([numpy.array([player.client_num for player in players], dtype=numpy.int32),
+                                        logged["client_num"]])
+        zeros = numpy.zeros(len(players), dtype=numpy.int32)
+        return {
+            "timestamp": numpy.concatenate([numpy.zeros(len(players)), logged["time"]]),
+            "player_id": player_ids,
+            "name": names[player_ids],
+            "team": teams[player_ids],
+            "frags": numpy.concatenate([zeros, logged["frags"]]),
+            "deaths": numpy.concatenate([zeros, logged["deaths"]]),
+        }
+
+    def item_columns(self):
+        """Return the item events as NumPy arrays by field, without building a dict per event."""
+        import numpy
+        state = self.state
+        players = [player for player in state.players.values() if not player.spectator]
+        logged = state.items.to_numpy()
+        zeros = numpy.zeros(len(players), dtype=numpy.int32)
+        columns = {
+            "timestamp": numpy.concatenate([numpy.zeros(len(players)), logged["time"]]),
+            "player_id": numpy.concatenate([numpy.array([player.client_num for player in players], dtype=numpy.int32),
+                                            logged["client_num"]]),
+        }
+        for field_name, column in zip(("quad", "pent", "flagtk", "flagcap"), ITEM_COLUMNS[2:]):
+            columns[field_name] = numpy.concatenate([zeros, logged[column[0]]])
+        return columns
+
+    def stats(self):
+        """Return the match statistics, as written to stats.json."""
+        state = self.state
+
+        players = []
+        for player in state.players.values():
+            if player.spectator:
+                continue
+            player_stats = {
+                "top-color": player.top_color,
+                "bottom-color": player.bottom_color,
+                "ping": 0,
+                "login": "",
+                "name": player.raw_name,
+                "team": player.team,
+                "client": "Quake 1.07",
+                "player_id": str(player.client_num),
+                "stats": {
+                    "frags": player.frags,
+                    "deaths": player.info["deaths"],
+                    "tk": player.info["tkills"],
+                    "spawn-frags": 0,
+                    "kills": player.info["kills"],
+                    "suicides": player.info["suicides"],
                 },
-                "ya": {
-                    "took": 0,
+                "dmg": {
+                    "taken": 0,
+                    "given": 0,
+                    "team": 0,
+                    "self": 0,
+                    "team-weapons": 0,
+                    "enemy-weapons": 0,
+                    "taken-to-die": 0,
                 },
-                "ra": {
-                    "took": 0,
+                "xfer": 0,
+                "spree": {
+                    "max": 0,
+                    "quad": 0,
                 },
-                "q": {
-                    "took": player.info["quad_count"],
-                    "time": 0,
+                "control": 0,
+                "speed": {
+                    "max": 0,
+                    "avg": 0,
                 },
-                "p": {
-                    "took": 0,
-                    "time": 0,
+                "weapons": {
                 },
-                "r": {
-                    "took": 0,
+                "items": {
+                    "health_15": {
+                        "took": 0,
+                    },
+                    "health_25": {
+                        "took": 0,
+                    },
+                    "health_100": {
+                        "took": 0,
+                    },
+                    "ga": {
+                        "took": 0,
+                    },
+                    "ya": {
+                        "took": 0,
+                    },
+                    "ra": {
+                        "took": 0,
+                    },
+                    "q": {
+                        "took": player.info["quad_count"],
+                        "time": 0,
+                    },
+                    "p": {
+                        "took": 0,
+                        "time": 0,
+                    },
+                    "r": {
+                        "took": 0,
+                    },
                 },
-            },
-            "ctf": {
-                "points": player.info["ctf-points"],
-                "caps": player.info["ctf-caps"],
-                "carrier-frags": player.info["ctf-carrier-frags"],
-                "carrier-defends": player.info["ctf-carrier-defends"],
-                "pickups": player.info["ctf-pickups"],
-                "returns": player.info["ctf-returns"],
-                "runes": [0, 0, 0, 0],
+                "ctf": {
+                    "points": player.info["ctf-points"],
+                    "caps": player.info["ctf-caps"],
+                    "carrier-frags": player.info["ctf-carrier-frags"],
+                    "carrier-defends": player.info["ctf-carrier-defends"],
+                    "pickups": player.info["ctf-pickups"],
+                    "returns": player.info["ctf-returns"],
+                    "runes": [0, 0, 0, 0],
+                }
             }
+
+            weapons = [
+                ("sg", "shotgun"),
+                ("ssg", "super_shotgun"),
+                ("ng", "nailgun"),
+                ("sng", "super-nailgun"),
+                ("gl", "grenade-launcher"),
+                ("rl", "rocket-launcher"),
+                ("lg", "lightning-gun")
+            ]
+
+            for shortname, weapon in weapons:
+                player_stats["weapons"][shortname] = {
+                    "acc": {
+                        "attacks": 0,
+                        "hits": 0,
+                    },
+                    "kills": {
+                        "total": player.info[f"kills-{weapon}"],
+                        "team": 0,
+                        "enemy": player.info[f"kills-{weapon}"],
+                        "self": player.info[f"suicide-{weapon}"],
+                    },
+                    "deaths": player.info[f"deaths-{weapon}"],
+                }
+            players.append(player_stats)
+
+        stats = {
+            "version": 3,
+            "date": "1997-05-25 20:00:00 +0100",
+            "map": state.map_name,
+            "hostname": "anka.pobox.se",
+            "ip": "127.0.0.1",
+            "port": 26000,
+            "mode": "ctf",
+            "tl": 20,
+            "dm": 1,
+            "tp": 4,
+            "duration": 1200,
+            "demo": "sm_970525_cop_vs_tfa_part1_e2m2.dem",
+            "teams": [
+                "red",
+                "blue",
+            ],
+    #        "clans": {
+    #            "red": {
+    #                "name": "Combat Plebs",
+    #                "short": "CoP"
+    #            },
+    #            "blue": {
+    #                "name": "The Fallen Angels",
+    #                "short": "TFA"
+    #            }
+    #        },
+            "players": players
         }
 
-        weapons = [
-            ("sg", "shotgun"),
-            ("ssg", "super_shotgun"),
-            ("ng", "nailgun"),
-            ("sng", "super-nailgun"),
-            ("gl", "grenade-launcher"),
-            ("rl", "rocket-launcher"),
-            ("lg", "lightning-gun")
-        ]
-
-        for shortname, weapon in weapons:
-            player_stats["weapons"][shortname] = {
-                "acc": {
-                    "attacks": 0,
-                    "hits": 0,
-                },
-                "kills": {
-                    "total": player.info[f"kills-{weapon}"],
-                    "team": 0,
-                    "enemy": player.info[f"kills-{weapon}"],
-                    "self": player.info[f"suicide-{weapon}"],
-                },
-                "deaths": player.info[f"deaths-{weapon}"],
-            }
-        players.append(player_stats)
-
-    stats = {
-        "version": 3,
-        "date": "1997-05-25 20:00:00 +0100",
-        "map": state.map_name,
-        "hostname": "anka.pobox.se",
-        "ip": "127.0.0.1",
-        "port": 26000,
-        "mode": "ctf",
-        "tl": 20,
-        "dm": 1,
-        "tp": 4,
-        "duration": 1200,
-        "demo": "sm_970525_cop_vs_tfa_part1_e2m2.dem",
-        "teams": [
-            "red",
-            "blue",
-        ],
-#        "clans": {
-#            "red": {
-#                "name": "Combat Plebs",
-#                "short": "CoP"
-#            },
-#            "blue": {
-#                "name": "The Fallen Angels",
-#                "short": "TFA"
-#            }
-#        },
-        "players": players
-    }
+        return stats
+
+    def write(self, output_dir=".", compress=False):
+        """Write frags.json, items.json and stats.json into `output_dir`, returning their paths.
+
+        With `compress` the files are gzipped, and named with a `.gz` suffix.
+        """
+        suffix = ".gz" if compress else ""
+        paths = [os.path.join(output_dir, name + suffix) for name in ("frags.json", "items.json", "stats.json")]
+
+        for path, events in zip(paths, (self.frag_events(), self.item_events())):
+            with jsonstream.open_output(path) as fd, jsonstream.ArrayWriter(fd) as writer:
+                for event in events:
+                    writer.write(event)
+
+        with jsonstream.open_output(paths[2]) as fd:
+            json.dump(self.stats(), fd)
+
+        return paths
+
+
+class DemoStats:
+    """Gathers statistics from demos, using one set of fragfile events for all of them."""
+
+    def __init__(self, events=None):
+        """`events` are those of a fragfile, by default the (cached) events of fragfile.dat."""
+        if events is None:
+            events = cached_fragfile()
+        if not isinstance(events, FragEventIndex):
+            events = FragEventIndex(events)
+        self.events = events
+
+    @staticmethod
+    def _print(out, *args):
+        if out is not None:
+            print(*args, file=out)
+
+    def _handle(self, state, msg, out):
+        if msg.msg_type == proto.ServerMessageType.SERVERINFO:
+            state.map_name = msg.models[0].rsplit('/', 1)[1].split('.', 1)[0]
+            map_name = msg.level_name
+            self._print(out, state.map_name, map_name)
+        elif msg.msg_type == proto.ServerMessageType.TIME:
+            state.time = msg.time
+        elif msg.msg_type in (proto.ServerMessageType.INTERMISSION,
+                              proto.ServerMessageType.FINALE):
+            if state.time > state.duration:
+                state.duration = state.time
+        elif msg.msg_type == proto.ServerMessageType.UPDATENAME:
+            if not msg.name:
+                return
+            state.set_player_name(msg.client_num, msg.name)
+        elif msg.msg_type == proto.ServerMessageType.UPDATEFRAGS:
+            if msg.count != 0:
+                # delta = msg.count - state.players[msg.client_num].frags
+                # p0 = state.players[msg.client_num]
+                # altsum = p0.info.get("ctf-points", 0) + p0.info.get("kills", 0) - p0.info.get("suicides", 0)
+                # matches = "MATCHES" if altsum == msg.count else "DIFF %d" % (msg.count - altsum)
+                # print(int(state.time), state.players[msg.client_num].name, msg.count, "alt:", altsum, "this delta:", delta, matches)
+                state.players[msg.client_num].frags = msg.count
+                state.log_frags(state.players[msg.client_num])
+        elif msg.msg_type == proto.ServerMessageType.UPDATECOLORS:
+            player = state.players.get(msg.client_num)
+            if not player:
+                return # non-client
+            player.top_color = (msg.color & 0xf0) >> 4
+            player.bottom_color = msg.color & 0x0f
+            if 4 in (player.top_color, player.bottom_color):
+                player.team = "red"
+            elif 13 in (player.top_color, player.bottom_color):
+                player.team = "blue"
+            else:
+                player.spectator = True
+        elif msg.msg_type == proto.ServerMessageType.PRINT:
+            if ord(msg.string[0]) == 1:
+                self._print(out, "chat:", fix_text(msg.string[1:]))
+                return
+            elif ord(msg.string[0]) == 2:
+                self._print(out, "server:", fix_text(msg.string[1:]))
+                return
+
+            if msg.string[-1] == '\n':
+                state.msg_buffer.append(msg.string[:-1])
+                if self.events.apply(state, state.msg_buffer) is None and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("NOT FOUND: '%s'", "".join(map(fix_text, state.msg_buffer)))
+                state.msg_buffer.clear()
+            else:
+                state.msg_buffer.append(msg.string)
+        elif msg.msg_type not in _IGNORED_MESSAGES:
+            self._print(out, msg.msg_type)
+
+    def process(self, demo, stream=None, out=None):
+        """Gather the statistics of `demo`, a path or binary file object, returning a `DemoStatsResult`.
+
+        If `stream` is a file object, each frag and item event is also written
+        to it as a line of JSON as soon as it is logged, so it can be followed
+        while the demo is parsed.  The map, chat and a summary of the players
+        are printed to `out`, if given.
+        """
+        state = State()
+        if stream is not None:
+            state.stream = jsonstream.LinesWriter(stream)
+
+        # Cached messages and sizes depend on the protocol of the demo they came from.
+        proto.clear_cache()
+        if isinstance(demo, (str, os.PathLike)):
+            messages = proto.read_demo_mmap(demo, _WANTED_MESSAGES)
+        else:
+            messages = proto.read_demo_file(demo, _WANTED_MESSAGES)
+
+        for msg_end, view_angle, msg in messages:
+            self._handle(state, msg, out)
+
+        self._print_summary(state, out)
+        return DemoStatsResult(state)
+
+    def follow(self, demo, publish, stream=None, out=None, poll_interval=0.1, idle_timeout=None):
+        """Like `process`, but for a demo that is still being recorded, publishing the scoreboard as it changes.
+
+        `demo` is a path, or a binary file object such as a pipe from a relay.
+        `publish` is called with the `State.scoreboard` at the start of each
+        server frame in which it changed, and once more at the end.  See
+        `proto.follow_demo_file` for `poll_interval` and `idle_timeout`.
+        """
+        state = State()
+        if stream is not None:
+            state.stream = jsonstream.LinesWriter(stream)
+
+        proto.clear_cache()
+        with contextlib.ExitStack() as stack:
+            if isinstance(demo, (str, os.PathLike)):
+                demo = stack.enter_context(open(demo, "rb"))
+
+            published = None
+            for msg_end, view_angle, msg in proto.follow_demo_file(demo, _WANTED_MESSAGES, poll_interval,
+                                                                   idle_timeout):
+                if msg.msg_type == proto.ServerMessageType.TIME:
+                    published = self._publish(state, publish, published)
+                self._handle(state, msg, out)
+
+        self._publish(state, publish, published)
+        self._print_summary(state, out)
+        return DemoStatsResult(state)
+
+    @staticmethod
+    def _publish(state, publish, published):
+        board = state.scoreboard()
+        if board != published:
+            publish(dict(board, timestamp=state.time))
+        return board
+
+    def _print_summary(self, state, out):
+        if out is None:
+            return
+
+        for p in sorted(state.players.values(), key=lambda x: x.frags, reverse=True):
+            if p.spectator:
+                continue
+            kills = p.info.get("kills", 0)
+            suicides = p.info.get("suicides", 0)
+            points = p.info.get("ctf-points", 0)
+            self._print(out, p.name, p.team, p.frags, "kills", kills, "ctf-points", points, "sum", kills + points - suicides, "delta", p.frags - (kills + points - suicides))
+            self._print(out, p.info)
+
+
+def demo_stats_entrypoint(events, demo_path, output_dir=".", compress=False, stream=None):
+    """Write frags.json, items.json and stats.json for the demo at `demo_path` into `output_dir`.
 
-    with open("stats.json", "w") as fd:
-        json.dump(stats, fd)
+    Progress is printed to stdout.  See `DemoStats.process` for `stream` and
+    `DemoStatsResult.write` for `compress`.
+    """
+    result = DemoStats(events).process(demo_path, stream, out=sys.stdout)
+    return result.write(output_dir, compress)
 
 
 pattern = re.compile('#DEFINE\\s+(?:(?:(?P<type1>[^\\s]+)\\s+(?P<subtype1>[^\\s]+)\\s+(?P<cause1>[^\\s]+))|(?:(?P<type2>[^\\s]+)\\s+(?P<subtype2>[^\\s]+)))\\s+"(?P<msg1>[^"]+)"(?:\\s+"(?P<msg2>[^"]+)")?(?:\\s+"(?P<msg3>[^"]+)")?.*')
@@ -458,24 +737,35 @@ class FragEvent:
             self.cause = cause
             self.quad = False
 
-    def apply(self, state, messages):
+    def match(self, state, messages):
+        """Return the players named in `messages` if they make up this event, otherwise `None`."""
         players = []
         for (matcher, message) in zip(self.matchers, messages):
             result = matcher.test(state, message)
             if not result:
-                return False
+                return None
             if isinstance(result, Player):
                 players.append(result)
-        logger.debug(
-            "%d %s %s, carriers: %s",
-            int(state.time),
-            self.__class__.__name__,
-            ", ".join(map(lambda x: x.name, players)),
-            ", ".join(carrier(state))
-        )
-        self.update_stats(state, players)
+        return players
+
+    def apply(self, state, messages):
+        players = self.match(state, messages)
+        if players is None:
+            return False
+        self.record(state, players)
         return True
 
+    def record(self, state, players):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%d %s %s, carriers: %s",
+                int(state.time),
+                self.__class__.__name__,
+                ", ".join(map(lambda x: x.name, players)),
+                ", ".join(carrier(state))
+            )
+        self.update_stats(state, players)
+
     def update_stats(self, players):
         raise NotImplementedError(f"{self.__class__.__name__} does not update stats")
 
@@ -687,9 +977,133 @@ class FlagEventFlagCarrierDangerDefend(FragEventFlagBase):
 
 
 
-def load_fragfile():
+class FragEventIndex:
+    """The events of a fragfile, indexed by the constant part following the first player name.
+
+    `apply` finds the same event as trying every event in fragfile order, but
+    only tries those whose second matcher is the message's second part (and any
+    without a constant there).
+    """
+
+    def __init__(self, events):
+        self.events = list(events)
+
+        self._wildcards = []
+        by_value = defaultdict(list)
+        for position, event in enumerate(self.events):
+            if len(event.matchers) > 1 and isinstance(event.matchers[1], ConstMatcher):
+                by_value[event.matchers[1].value].append(position)
+            else:
+                self._wildcards.append(position)
+
+        self._index = {
+            value: [self.events[i] for i in sorted(positions + self._wildcards)]
+            for value, positions in by_value.items()
+        }
+        self._wildcards = [self.events[i] for i in self._wildcards]
+
+    def candidates(self, messages):
+        """Return the events that may match `messages`, in fragfile order."""
+        if len(messages) < 2:
+            # Events only test as many parts as there are, so any may match.
+            return self.events
+        return self._index.get(messages[1], self._wildcards)
+
+    def find(self, state, messages):
+        """Return the first event matching `messages` and the players it names, or `(None, None)`."""
+        for event in self.candidates(messages):
+            players = event.match(state, messages)
+            if players is not None:
+                return event, players
+        return None, None
+
+    def apply(self, state, messages):
+        """Apply the first event matching `messages` to `state`, returning it, or `None` if none match."""
+        event, players = self.find(state, messages)
+        if event is not None:
+            event.record(state, players)
+        return event
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+
+class CompiledFragEventIndex(FragEventIndex):
+    """A `FragEventIndex` that recognizes messages with a single regular expression.
+
+    Each event becomes one branch of an alternation over the message parts
+    joined by NUL (which cannot occur in a message), with constants matched
+    literally and player names as any non-empty part.  The first branch that
+    matches names the event, which is then checked against the known players;
+    only if that fails are the indexed candidates tried.
+    """
+
+    _SEPARATOR = "\0"
+
+    def __init__(self, events):
+        super().__init__(events)
+
+        # Fragfile events all start with a player name, so match it once
+        # rather than in every branch.
+        prefix = ""
+        if self.events and all(event.matchers and isinstance(event.matchers[0], PlayerMatcher)
+                               for event in self.events):
+            prefix = self._part_pattern(self.events[0].matchers[0])
+
+        branches = [f"{self._event_pattern(event, bool(prefix))}\\Z(?P<e{position}>)"
+                    for position, event in enumerate(self.events)]
+        self._pattern = re.compile(f"{prefix}(?:{'|'.join(branches)})", re.DOTALL) if branches else None
+
+    @staticmethod
+    def _part_pattern(matcher):
+        if isinstance(matcher, ConstMatcher):
+            return re.escape(matcher.value)
+        # Stops at the NUL ending the part, so backtracking into it never finds another match.
+        return "[^\\0]+"
+
+    @classmethod
+    def _event_pattern(cls, event, skip_first=False):
+        # Events only test as many parts as there are, so each part after the
+        # second is optional, and any parts after the last are ignored.  Messages
+        # of a single part are left to the index.
+        if len(event.matchers) < 2:
+            return ".*"
+        pattern = "(?:\\0.*)?"
+        for matcher in reversed(event.matchers[2:]):
+            pattern = f"(?:\\0{cls._part_pattern(matcher)}{pattern})?"
+        pattern = f"\\0{cls._part_pattern(event.matchers[1])}{pattern}"
+        if skip_first:
+            return pattern
+        return cls._part_pattern(event.matchers[0]) + pattern
+
+    def find(self, state, messages):
+        if self._pattern is None or len(messages) < 2:
+            return super().find(state, messages)
+
+        text = self._SEPARATOR.join(messages)
+        if text.count(self._SEPARATOR) != len(messages) - 1:
+            return super().find(state, messages)
+
+        m = self._pattern.match(text)
+        if m is None:
+            return None, None
+
+        event = self.events[int(m.lastgroup[1:])]
+        players = event.match(state, messages)
+        if players is not None:
+            return event, players
+
+        # Matched by shape but not by player names, so a later event may match.
+        return super().find(state, messages)
+
+
+def load_fragfile(path="fragfile.dat", compiled=False):
+    """Load the events of the fragfile at `path` into a `FragEventIndex`, or a `CompiledFragEventIndex`."""
     msgs = []
-    with open("fragfile.dat", "r", encoding="latin1") as fd:
+    with open(path, "r", encoding="latin1") as fd:
         for line in fd:
             message_found = True
 
@@ -739,11 +1153,55 @@ def load_fragfile():
             if not message_found:
                 raise NotImplementedError(f"Message not found: '{line}'")
 
-    return msgs
+    return (CompiledFragEventIndex if compiled else FragEventIndex)(msgs)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_fragfile(path, mtime_ns, size, compiled):
+    return load_fragfile(path, compiled)
+
+
+def cached_fragfile(path="fragfile.dat", compiled=False):
+    """Like `load_fragfile`, but returns the events loaded before for as long as the file is unchanged."""
+    st = os.stat(path)
+    return _cached_fragfile(os.path.abspath(path), st.st_mtime_ns, st.st_size, compiled)
 
 # #DEFINE\s(?:(?:(?P<type1>[^\s]+)\s+(?P<subtype1>[^\s]+)\s+(?P<cause1>[^\s]+))|(?:(?P<type2>[^\s]+)\s+(?P<subtype2>[^\s]+)))\s+"(?P<prefix>[^"]+)"(?:\s+"(?P<suffix>[^"]+)")?.*
 
 
-evs = load_fragfile()
+def main():
+    parser = argparse.ArgumentParser(description="Extract frags, items and stats from a NetQuake demo.")
+    parser.add_argument("demo", help="demo to process")
+    parser.add_argument("--fragfile", default="fragfile.dat", help="fragfile of the obituaries and flag messages")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory to write the JSON files into")
+    parser.add_argument("-z", "--gzip", action="store_true", help="gzip the JSON files")
+    parser.add_argument("--events", metavar="FILE", help="also write each event to FILE as JSON lines, as it is found")
+    parser.add_argument("-f", "--follow", action="store_true",
+                        help="follow a demo still being recorded ('-' for stdin), printing the scoreboard "
+                             "as JSON lines whenever it changes")
+    parser.add_argument("--idle-timeout", type=float, metavar="SECONDS",
+                        help="with --follow, stop once the demo has not grown for this long")
+    args = parser.parse_args()
+
+    # Tracing of matched and unmatched messages, off by default.
+    if os.environ.get("DEMSTATS_TRACE"):
+        logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+
+    evs = load_fragfile(args.fragfile)
+
+    with contextlib.ExitStack() as stack:
+        stream = stack.enter_context(open(args.events, "w")) if args.events else None
+
+        if args.follow:
+            def publish(board):
+                print(json.dumps(board), flush=True)
+
+            demo = sys.stdin.buffer if args.demo == "-" else args.demo
+            result = DemoStats(evs).follow(demo, publish, stream, idle_timeout=args.idle_timeout)
+            result.write(args.output_dir, args.gzip)
+        else:
+            demo_stats_entrypoint(evs, args.demo, args.output_dir, args.gzip, stream)
+
 
-demo_stats_entrypoint(evs)
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 #!/usr/bin/env python
+import argparse
+import dataclasses
+import json
 import os
 import os.path
+import queue
 import sys
 import subprocess
 import tempfile
+import threading
+
+import demstats
+import vis2
 
 template = """
 #EVENT DEMOSTART 1
@@ -112,51 +120,321 @@ def exists(path):
     except FileNotFoundError:
         return False
 
-if len(sys.argv) < 2:
-    raise SystemExit("ERR: Need demo argument")
+def _write_templates(workdir):
+    """Write mvdparser's templates into `workdir`."""
+    os.makedirs(workdir, exist_ok=True)
+
+    with open(os.path.join(workdir, "template.dat"), "w") as fd:
+        fd.write(template)
+
+    with open(os.path.join(workdir, "fragfile.dat"), "w") as fd:
+        fd.write(fragfile)
+
+
+def _link_demo(demofile, workdir):
+    """Link `demofile` into `workdir` for mvdparser, clearing previous output, and return the output paths."""
+    workfile = os.path.join(workdir, "demo.mvd")
+    frags_path = os.path.join(workdir, "frags.json")
+    items_path = os.path.join(workdir, "items.json")
+
+    if exists(workfile):
+        if not os.path.islink(workfile):
+            raise SystemExit(f"ERR: {workfile} is not a symlink!")
+        os.unlink(workfile)
+
+    if exists(frags_path):
+        os.unlink(frags_path)
+
+    if exists(items_path):
+        os.unlink(items_path)
+
+    os.symlink(os.path.abspath(demofile), workfile)
+
+    return frags_path, items_path
+
+
+def _prepare(demofile, workdir):
+    """Write the templates into `workdir` and link `demofile` there for mvdparser, returning the output paths."""
+    _write_templates(workdir)
+    return _link_demo(demofile, workdir)
+
+
+def _run_mvdparser(demofile, workdir):
+    frags_path, items_path = _prepare(demofile, workdir)
+
+    proc = subprocess.run(["mvdparser", "demo.mvd"], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    error = _missing_output(frags_path, items_path)
+    if error:
+        raise SystemExit(f"ERR: {error}{_describe_exit(proc.returncode, proc.stderr)}")
+
+    return frags_path, items_path
+
+
+def _missing_output(frags_path, items_path):
+    if not exists(frags_path):
+        return "No frags.json generated"
+    if not exists(items_path):
+        return "No items.json generated"
+    return None
+
+
+def _decode(stderr):
+    return (stderr or b"").decode(errors="replace").strip()
+
+
+def _describe_exit(returncode, stderr):
+    stderr = _decode(stderr)
+    return f" (mvdparser exited with {returncode}{': ' + stderr if stderr else ''})"
+
+
+def _extra_path(demofile, workdir):
+    basename = os.path.basename(demofile)
+    for ext in (".gz", ".mvd", ".dem"):
+        if basename.endswith(ext):
+            basename = basename[:-len(ext)]
+    return os.path.join(workdir, f"{basename}.extra.json")
+
+
+def extra_for_mvd(demofile, workdir="process"):
+    """Return the extra.json contents for the MVD demo `demofile`, running mvdparser in `workdir`.
+
+    mvdparser's output is passed to vis2 in memory, rather than through a second process.
+    """
+    frags_path, items_path = _run_mvdparser(demofile, workdir)
+    return _extra_from_output(frags_path, items_path)
+
+
+def _extra_from_output(frags_path, items_path):
+    with open(frags_path) as fd:
+        frags = json.load(fd)[:-1] # [:-1] due to hacky stats generator
+
+    with open(items_path) as fd:
+        items = json.load(fd)[:-1] # [:-1] due to hacky stats generator
 
-demofile = sys.argv[1]
+    os.unlink(frags_path)
+    os.unlink(items_path)
 
-os.makedirs("process", exist_ok=True)
+    return vis2.extra_numpy(frags, items)
 
-with open("process/template.dat", "w") as fd:
-    fd.write(template)
 
-with open("process/fragfile.dat", "w") as fd:
-    fd.write(fragfile)
+def extra_for_dem(demofile, events=None):
+    """Return the extra.json contents for the NetQuake demo `demofile`, gathered by demstats in this process.
 
+    `events` are the fragfile events for `demstats.DemoStats`, by default those of fragfile.dat.
+    """
+    result = demstats.DemoStats(events).process(demofile)
+    return vis2.extra_columns(result.frag_columns(), result.item_columns())
 
-workfile = "process/demo.mvd"
 
-if exists(workfile):
-    if not os.path.islink(workfile):
-        raise SystemExit(f"ERR: {workfile} is not a symlink!")
-    os.unlink(workfile)
+def generate(demofile, output_dir="process", workdir=None, in_process=True, events=None):
+    """Generate the extra.json of `demofile` in `output_dir`, returning its path.
 
-if exists("process/frags.json"):
-    os.unlink("process/frags.json")
+    MVD demos are parsed by mvdparser, and by default its output goes to vis2 in
+    memory.  With `in_process` false, vis2.py is run as a subprocess on files
+    instead, as before.  NetQuake demos (`.dem`) are always handled in this
+    process by demstats, using the fragfile `events`.
 
-if exists("process/items.json"):
-    os.unlink("process/items.json")
+    mvdparser runs in a temporary directory of its own, so that several runs
+    can go at once, or in `workdir` if given, which only one run may use at a
+    time.
+    """
+    if workdir is None and not demofile.endswith((".dem", ".dem.gz")):
+        with tempfile.TemporaryDirectory(prefix="gen-extra-") as workdir:
+            return generate(demofile, output_dir, workdir, in_process, events)
 
-os.symlink(demofile, workfile)
+    os.makedirs(output_dir, exist_ok=True)
+    extra_path = _extra_path(demofile, output_dir)
 
-subprocess.run(["mvdparser", "demo.mvd"], cwd="process", capture_output=True)
+    if demofile.endswith((".dem", ".dem.gz")):
+        result = extra_for_dem(demofile, events)
+    elif in_process:
+        result = extra_for_mvd(demofile, workdir)
+    else:
+        os.replace(_generate_subprocess(demofile, workdir), extra_path)
+        return extra_path
 
-if not exists("process/frags.json"):
-    raise SystemExit("ERR: No frags.json generated")
+    with open(extra_path, "w") as fd:
+        json.dump(result, fd)
+    return extra_path
 
-if not exists("process/items.json"):
-    raise SystemExit("ERR: No items.json generated")
 
-basename, _ = os.path.splitext(os.path.basename(demofile))
+def _generate_subprocess(demofile, workdir):
+    frags_path, items_path = _run_mvdparser(demofile, workdir)
 
-os.rename("process/frags.json", f"process/{basename}.frags.json")
-os.rename("process/items.json", f"process/{basename}.items.json")
+    basename, _ = os.path.splitext(os.path.basename(demofile))
 
-visualize = os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), "vis2.py")
+    os.rename(frags_path, os.path.join(workdir, f"{basename}.frags.json"))
+    os.rename(items_path, os.path.join(workdir, f"{basename}.items.json"))
 
-subprocess.run([visualize, f"{basename}"], cwd="process")
+    visualize = os.path.join(os.path.abspath(os.path.dirname(__file__)), "vis2.py")
 
-os.unlink(f"process/{basename}.frags.json")
-os.unlink(f"process/{basename}.items.json")
+    subprocess.run([visualize, f"{basename}"], cwd=workdir)
+
+    os.unlink(os.path.join(workdir, f"{basename}.frags.json"))
+    os.unlink(os.path.join(workdir, f"{basename}.items.json"))
+
+    return _extra_path(demofile, workdir)
+
+
+@dataclasses.dataclass
+class JobResult:
+    demo: str
+    extra_path: str = None      # The extra.json written, on success.
+    returncode: int = None      # mvdparser's exit code, None if it did not run or timed out.
+    stderr: str = ""            # What mvdparser wrote to stderr.
+    error: str = None           # Why no extra.json was written, on failure.
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class MvdparserPool:
+    """A fixed number of workers generating the extra.json of a queue of demos.
+
+    Each worker owns a directory under `workdir`, a temporary one by default,
+    with the templates written once, and runs one mvdparser at a time in it.
+    An mvdparser still running after `timeout` seconds is killed.
+
+    NetQuake demos are parsed by demstats, using the fragfile `events`, one at
+    a time in the calling thread while the workers run mvdparser: proto's
+    message caches are shared by all threads, so parses must not overlap.
+    """
+
+    def __init__(self, workers=1, output_dir="process", timeout=None, workdir=None, events=None):
+        self.workers = workers
+        self.output_dir = output_dir
+        self.timeout = timeout
+        self.workdir = workdir
+        self.events = events
+
+    def run(self, demos):
+        """Generate the extra.json of each of `demos`, yielding a `JobResult` for each as it finishes."""
+        demos = list(demos)
+        if not demos:
+            return
+
+        mvds = [demo for demo in demos if not demo.endswith((".dem", ".dem.gz"))]
+        dems = [demo for demo in demos if demo.endswith((".dem", ".dem.gz"))]
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        tasks = queue.Queue()
+        results = queue.Queue()
+        for demo in mvds:
+            tasks.put(demo)
+
+        with tempfile.TemporaryDirectory(prefix="gen-extra-", dir=self.workdir) as base:
+            threads = []
+            for i in range(min(self.workers, len(mvds))):
+                workdir = os.path.join(base, f"worker{i}")
+                _write_templates(workdir)
+                tasks.put(None)
+                thread = threading.Thread(target=self._work, args=(workdir, tasks, results), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            try:
+                for demo in dems:
+                    yield self._process_dem(demo)
+                for _ in mvds:
+                    yield results.get()
+            finally:
+                # Stop the workers early if not all results were wanted.
+                try:
+                    while True:
+                        tasks.get_nowait()
+                except queue.Empty:
+                    pass
+                for _ in threads:
+                    tasks.put(None)
+                for thread in threads:
+                    thread.join()
+
+    def _work(self, workdir, tasks, results):
+        while True:
+            demo = tasks.get()
+            if demo is None:
+                return
+            results.put(self._process(demo, workdir))
+
+    def _process_dem(self, demo):
+        result = JobResult(demo)
+        try:
+            result.extra_path = generate(demo, self.output_dir, events=self.events)
+        except (Exception, SystemExit) as e:
+            result.error = _describe_error(e)
+        return result
+
+    def _process(self, demo, workdir):
+        result = JobResult(demo)
+        try:
+            frags_path, items_path = _link_demo(demo, workdir)
+            try:
+                proc = subprocess.run(["mvdparser", "demo.mvd"], cwd=workdir, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE, timeout=self.timeout)
+            except subprocess.TimeoutExpired as e:
+                result.stderr = _decode(e.stderr)
+                result.error = f"mvdparser timed out after {self.timeout:g}s"
+                return result
+
+            result.returncode = proc.returncode
+            result.stderr = _decode(proc.stderr)
+            result.error = _missing_output(frags_path, items_path)
+            if result.error:
+                return result
+
+            extra_path = _extra_path(demo, self.output_dir)
+            with open(extra_path, "w") as fd:
+                json.dump(_extra_from_output(frags_path, items_path), fd)
+            result.extra_path = extra_path
+        except (Exception, SystemExit) as e:
+            result.error = _describe_error(e)
+        return result
+
+
+def _describe_error(e):
+    if isinstance(e, SystemExit):
+        return str(e).removeprefix("ERR: ")
+    return f"{type(e).__name__}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the extra.json of demos.")
+    parser.add_argument("demos", nargs="+", metavar="demo", help="MVD or NetQuake demo")
+    parser.add_argument("-o", "--output-dir", default="process", help="directory to write the extra.json into")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of mvdparser workers")
+    parser.add_argument("--timeout", type=float, help="seconds after which to kill mvdparser on a demo")
+    parser.add_argument("--workdir", help="directory the worker directories are created in, or with --subprocess the one "
+                        "mvdparser runs in; by default a temporary one")
+    parser.add_argument("--fragfile", default="fragfile.dat", help="fragfile used for NetQuake demos")
+    parser.add_argument("--subprocess", action="store_true", help="run vis2.py as a separate process, on files")
+    args = parser.parse_args()
+
+    events = None
+    if any(demo.endswith((".dem", ".dem.gz")) for demo in args.demos):
+        events = demstats.load_fragfile(args.fragfile)
+
+    if args.subprocess:
+        for demo in args.demos:
+            generate(demo, args.output_dir, args.workdir, False, events)
+        return 0
+
+    failed = 0
+    pool = MvdparserPool(args.jobs, args.output_dir, args.timeout, args.workdir, events)
+    for result in pool.run(args.demos):
+        if result.ok:
+            print("success", result.demo)
+            continue
+
+        failed += 1
+        exit_status = "" if result.returncode is None else f" (mvdparser exited with {result.returncode})"
+        print(f"failed {result.demo}: {result.error}{exit_status}", file=sys.stderr)
+        for line in result.stderr.splitlines():
+            print(f"    {line}", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
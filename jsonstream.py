@@ -0,0 +1,57 @@
+"""Incremental JSON writers, for writing out events without first collecting them in a list.
+
+`ArrayWriter` writes a JSON array one element at a time, producing the same
+text as `json.dump` of the whole list.  `LinesWriter` writes JSON Lines, one
+object per line, which other tools can read while it is still being written.
+"""
+
+__all__ = (
+    'open_output',
+    'ArrayWriter',
+    'LinesWriter',
+)
+
+
+import gzip
+import json
+
+
+def open_output(path):
+    """Open `path` for writing text, gzip compressed if it ends with `.gz`."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt")
+    return open(path, "w")
+
+
+class ArrayWriter:
+    def __init__(self, fd):
+        self.fd = fd
+        self.count = 0
+
+    def write(self, obj):
+        self.fd.write(", " if self.count else "[")
+        self.fd.write(json.dumps(obj))
+        self.count += 1
+
+    def close(self):
+        self.fd.write("]" if self.count else "[]")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class LinesWriter:
+    def __init__(self, fd, flush=True):
+        self.fd = fd
+        self.flush = flush
+        self.count = 0
+
+    def write(self, obj):
+        self.fd.write(json.dumps(obj) + "\n")
+        if self.flush:
+            self.fd.flush()
+        self.count += 1
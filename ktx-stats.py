@@ -1,40 +1,44 @@
 #!/usr/bin/env python
-import struct
 import json
 import sys
 import os
 import gzip
 
+import mvd
 
-demoname = os.path.basename(sys.argv[1].rstrip(".gz"))
 
-fopen = gzip.open if sys.argv[1].endswith(".gz") else open
+def extract(path):
+    """Return the KTX stats JSON embedded in the demo at `path`, as bytes.
 
-with fopen(sys.argv[1], "rb") as fd:
-    data = fd.read()
+    Empty if the demo has no stats.
+    """
+    fopen = gzip.open if path.endswith(".gz") else open
 
-# Hacky zoom-in of correct area, json blob contains demo filename.
-offset = data.rfind(demoname.encode())
+    with fopen(path, "rb") as fd:
+        content = mvd.read_demo_info(fd)
 
-offset = data[:offset].rfind(b"\x0a\x00\x00\x03\x00\x00\x00\x00")
-offset += 2
+    return content or b""
 
-content = b""
 
-while data[offset:offset + 4] == b"\x00\x03\x00\x00":
-    (length,) = struct.unpack("<H", data[offset+10:offset+12])
-    start = offset + 18
-    end = start + length - 2
-    content += data[start:end]
-    offset = end
+def main():
+    try:
+        content = extract(sys.argv[1])
+    except (mvd.MalformedDemo, OSError, EOFError) as e:
+        print(e)
+        print("failed to load", sys.argv[1])
+        return
 
-try:
-    json.loads(content)
-    print("success", sys.argv[1])
-    (name, _) = os.path.splitext(sys.argv[1])
+    try:
+        json.loads(content)
+        print("success", sys.argv[1])
+        (name, _) = os.path.splitext(sys.argv[1])
 
-    with open(name + ".json", "wb+") as fd:
-        fd.write(content)
-except:
-    print(content)
-    print("failed to load", sys.argv[1])
+        with open(name + ".json", "wb+") as fd:
+            fd.write(content)
+    except ValueError:
+        print(content)
+        print("failed to load", sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Block level reader for QuakeWorld MVD demos.
+
+An MVD demo is a sequence of blocks, each starting with a one byte time delta
+and a command byte whose low three bits give the block type.  Blocks carry
+server messages addressed to some or all players.  A `MULTIPLE` block addressed
+to no players holds hidden messages instead, which servers and mods such as KTX
+use to embed extra data like the end of match statistics.
+"""
+
+__all__ = (
+    'MalformedDemo',
+    'BlockType',
+    'HiddenMessageType',
+    'Block',
+    'read_blocks',
+    'read_hidden_messages',
+    'read_demo_info',
+)
+
+
+import dataclasses
+import enum
+import struct
+
+
+class MalformedDemo(Exception):
+    pass
+
+
+class BlockType(enum.IntEnum):
+    CMD = 0
+    READ = 1
+    SET = 2
+    MULTIPLE = 3
+    SINGLE = 4
+    STATS = 5
+    ALL = 6
+
+
+class HiddenMessageType(enum.IntEnum):
+    ANTILAG_POSITION = 0x0000
+    USERCMD = 0x0001
+    USERCMD_WEAPONS = 0x0002
+    DEMOINFO = 0x0003
+    COMMENTARY_TRACK = 0x0004
+    COMMENTARY_DATA = 0x0005
+    COMMENTARY_TEXT_SEGMENT = 0x0006
+    DMGDONE = 0x0007
+    EXTENDED = 0xFFFF
+
+
+@dataclasses.dataclass
+class Block:
+    time: int           # Milliseconds since the previous block.
+    block_type: BlockType
+    to: int             # Player mask for MULTIPLE, player number for SINGLE and STATS, otherwise 0.
+    data: bytes
+
+    @property
+    def hidden(self):
+        return self.block_type == BlockType.MULTIPLE and self.to == 0
+
+
+_BLOCK_TYPES = tuple(BlockType)
+_HEADER = struct.Struct("<BBi")
+_INT32 = struct.Struct("<i")
+_SET_SIZE = 8
+_HIDDEN_HEADER = struct.Struct("<iH")
+_DEMOINFO_HEADER = struct.Struct("<h")
+
+# Plain int block types, to keep enum comparisons out of the block loop.
+_CMD = int(BlockType.CMD)
+_SET = int(BlockType.SET)
+_MULTIPLE = int(BlockType.MULTIPLE)
+_SINGLE = int(BlockType.SINGLE)
+_STATS = int(BlockType.STATS)
+
+
+def _read(f, n):
+    s = f.read(n)
+    if len(s) != n:
+        raise MalformedDemo('Unexpected end of demo')
+    return s
+
+
+def read_blocks(f, block_types=None):
+    """Iterate the blocks of the MVD demo in file object `f`.
+
+    If `block_types` is given, only blocks of those types are yielded, and the
+    others are skipped over without reading their data.
+    """
+    wanted = None if block_types is None else {int(t) for t in block_types}
+    seekable = f.seekable()
+
+    while True:
+        # Most blocks start with the time, the command and an int32, so read
+        # those together.
+        header = f.read(_HEADER.size)
+        if not header:
+            break
+        if len(header) != _HEADER.size:
+            raise MalformedDemo('Unexpected end of demo')
+        time, cmd, value = _HEADER.unpack(header)
+        kind = cmd & 7
+
+        to = 0
+        if kind == _SET:
+            # No length, the int32 read is the first half of the two sequence numbers.
+            size = _SET_SIZE - 4
+            if wanted is None or kind in wanted:
+                yield Block(time, _BLOCK_TYPES[kind], to, header[2:] + _read(f, size))
+            elif seekable:
+                f.seek(size, 1)
+            else:
+                _read(f, size)
+            continue
+
+        if kind == _MULTIPLE:
+            to = value
+            (size,) = _INT32.unpack(_read(f, _INT32.size))
+        elif kind == _CMD or kind == 7:
+            raise MalformedDemo(f'Unsupported block type {kind}')
+        else:
+            if kind == _SINGLE or kind == _STATS:
+                to = cmd >> 3
+            size = value
+
+        if size < 0:
+            raise MalformedDemo(f'Negative block length {size}')
+
+        if wanted is None or kind in wanted:
+            yield Block(time, _BLOCK_TYPES[kind], to, _read(f, size))
+        elif seekable:
+            f.seek(size, 1)
+        else:
+            _read(f, size)
+
+
+def read_hidden_messages(data):
+    """Iterate the `(type, payload)` of each hidden message in the data of a hidden block."""
+    pos = 0
+    while pos < len(data):
+        if pos + _HIDDEN_HEADER.size > len(data):
+            raise MalformedDemo('Truncated hidden message header')
+        length, msg_type = _HIDDEN_HEADER.unpack_from(data, pos)
+        pos += _HIDDEN_HEADER.size
+        if length < 0 or pos + length > len(data):
+            raise MalformedDemo('Hidden message overruns its block')
+        yield msg_type, data[pos:pos + length]
+        pos += length
+
+
+def read_demo_info(f):
+    """Return the demo info payload (KTX's JSON statistics) of the MVD demo in `f`, or `None`.
+
+    The payload is split over consecutive demo info hidden messages, each
+    prefixed with its block number.  Reading stops at the first `MULTIPLE` block
+    after them without demo info, or at the end of the demo, so the rest of the
+    demo is not looked at.
+    """
+    fragments = []
+
+    for block in read_blocks(f, {BlockType.MULTIPLE}):
+        in_run = False
+        if block.to == 0:
+            for msg_type, payload in read_hidden_messages(block.data):
+                if msg_type == HiddenMessageType.DEMOINFO:
+                    fragments.append(payload[_DEMOINFO_HEADER.size:])
+                    in_run = True
+
+        if fragments and not in_run:
+            break
+
+    return b"".join(fragments) if fragments else None
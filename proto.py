@@ -22,18 +22,27 @@ __all__ = (
     'MalformedNetworkData',
     'ServerMessage',
     'read_demo_file',
+    'read_demo_mmap',
+    'follow_demo_file',
     'clear_cache',
+    'cache_info',
+    'set_cache_size',
     'UnsupportedProtocol',
 )
 
 
+import collections
 import dataclasses
 import enum
 import functools
-import inspect
+import gzip
 import math
+import mmap
 import os
 import struct
+import time
+import types
+import typing
 
 
 class MalformedNetworkData(Exception):
@@ -73,6 +82,38 @@ class Protocol:
     version: ProtocolVersion
     flags: ProtocolFlags
 
+    # Decoders for this protocol's coord and angle encodings, and the message class
+    # for each message type byte.  These are picked once, when the protocol is
+    # created, rather than branching on the flags for every field parsed.
+    parse_coord: typing.Callable = dataclasses.field(init=False, repr=False, compare=False)
+    parse_coords: typing.Callable = dataclasses.field(init=False, repr=False, compare=False)
+    coord_size: int = dataclasses.field(init=False, repr=False, compare=False)
+    parse_angle: typing.Callable = dataclasses.field(init=False, repr=False, compare=False)
+    parse_angles: typing.Callable = dataclasses.field(init=False, repr=False, compare=False)
+    angle_size: int = dataclasses.field(init=False, repr=False, compare=False)
+    message_classes: tuple = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        flags = int(self.flags)
+
+        if flags & int(ProtocolFlags.FLOATCOORD):
+            self.parse_coord, self.parse_coords, self.coord_size = _parse_coord_float, _parse_coords_float, 4
+        elif flags & int(ProtocolFlags.INT32COORD):
+            self.parse_coord, self.parse_coords, self.coord_size = _parse_coord_int32, _parse_coords_int32, 4
+        elif flags & int(ProtocolFlags._24BITCOORD):
+            self.parse_coord, self.parse_coords, self.coord_size = _parse_coord_24bit, _parse_coords_24bit, 3
+        else:
+            self.parse_coord, self.parse_coords, self.coord_size = _parse_coord_int16, _parse_coords_int16, 2
+
+        if flags & int(ProtocolFlags.FLOATANGLE):
+            self.parse_angle, self.parse_angles, self.angle_size = _parse_angle_float, _parse_angles_float, 4
+        elif flags & int(ProtocolFlags.SHORTANGLE):
+            self.parse_angle, self.parse_angles, self.angle_size = _parse_angle_int16, _parse_angles_int16, 2
+        else:
+            self.parse_angle, self.parse_angles, self.angle_size = _parse_angle_int8, _parse_angles_int8, 1
+
+        self.message_classes = _message_class_table(self.version)
+
 
 class TempEntityTypes(enum.IntEnum):
     SPIKE = 0
@@ -266,130 +307,335 @@ class _BaselineBits(enum.IntFlag):
     ALPHA = (1<<2)
 
 
+def _popcount(x):
+    return bin(x).count('1')
+
+
+def _flag_values(flag_cls):
+    """Return a namespace with the plain int value of each member of `flag_cls`.
+
+    The parsers test raw flags against these, since `&` and `|` on enum flags
+    construct a new enum instance each time.  `FITZQUAKE` holds the combined
+    protocol 666 flags, for classes that define them.
+    """
+    values = {name: int(member) for name, member in flag_cls.__members__.items()}
+    if hasattr(flag_cls, 'fitzquake_flags'):
+        values['FITZQUAKE'] = int(flag_cls.fitzquake_flags())
+    return types.SimpleNamespace(**values)
+
+
+_UPDATE_FLAGS = _flag_values(_UpdateFlags)
+_CLIENT_DATA_FLAGS = _flag_values(_ClientDataFlags)
+_SOUND_FLAGS = _flag_values(_SoundFlags)
+_BASELINE_BITS = _flag_values(_BaselineBits)
+
+
+class _EnumField:
+    """Message field held as a plain int, and converted to `enum_cls` when read.
+
+    This keeps enum construction out of the parsers for fields that most
+    consumers never look at.
+    """
+    def __init__(self, enum_cls):
+        self.enum_cls = enum_cls
+
+    def __set_name__(self, owner, name):
+        self.attr = '_' + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.attr)
+        return None if value is None else self.enum_cls(value)
+
+    def __set__(self, instance, value):
+        setattr(instance, self.attr, value)
+
+
+CacheInfo = collections.namedtuple('CacheInfo', ('hits', 'misses', 'evictions', 'maxsize', 'currsize'))
+
+
+class _LRUCache:
+    """Mapping with a bounded number of entries, evicting the least recently used.
+
+    A `maxsize` of `None` means the cache is unbounded.
+    """
+    def __init__(self, maxsize):
+        self._data = collections.OrderedDict()
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self):
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+
 _MESSAGE_CLASSES = {}
 def _register_server_message(cls):
     _MESSAGE_CLASSES[cls.msg_type] = cls
 
 
+@functools.lru_cache(None)
+def _message_class_table(version):
+    """Map each message type byte to its message class, for messages allowed by protocol `version`.
+
+    Bytes with the high bit set are entity updates.  Entries are `None` for
+    bytes that are not valid messages under `version`.  A `version` of `None`
+    allows every message type.
+    """
+    table = [None] * 256
+    for msg_type, msg_cls in _MESSAGE_CLASSES.items():
+        if msg_type != ServerMessageType.UPDATE and (version is None or version in msg_cls.protocols):
+            table[msg_type.value] = msg_cls
+    table[_UPDATE_FLAGS.SIGNAL:] = [ServerMessageUpdate] * (256 - _UPDATE_FLAGS.SIGNAL)
+    return tuple(table)
+
+
+# Precompiled formats for the fields shared by many messages.  Message specific
+# formats live on the message classes.
+_UINT8 = struct.Struct("<B")
+_INT8 = struct.Struct("<b")
+_UINT16 = struct.Struct("<H")
+_INT16 = struct.Struct("<h")
+_UINT32 = struct.Struct("<I")
+_INT32 = struct.Struct("<i")
+_FLOAT32 = struct.Struct("<f")
+_COORD24 = struct.Struct("<hB")
+_COORDS_INT16 = struct.Struct("<3h")
+_COORDS_INT32 = struct.Struct("<3i")
+_COORDS_FLOAT32 = struct.Struct("<3f")
+_ANGLES_INT8 = struct.Struct("<3B")
+
+
+# Coord and angle decoders for each protocol encoding, bound to a `Protocol` when
+# it is created.  Each takes the buffer and offset, and returns the decoded value
+# (or triple of values) along with the offset just past it.
+
+def _parse_coord_int16(m, pos):
+    return _INT16.unpack_from(m, pos)[0] / 8, pos + 2
+
+
+def _parse_coords_int16(m, pos):
+    x, y, z = _COORDS_INT16.unpack_from(m, pos)
+    return (x / 8, y / 8, z / 8), pos + 6
+
+
+def _parse_coord_int32(m, pos):
+    return _INT32.unpack_from(m, pos)[0] / 16, pos + 4
+
+
+def _parse_coords_int32(m, pos):
+    x, y, z = _COORDS_INT32.unpack_from(m, pos)
+    return (x / 16, y / 16, z / 16), pos + 12
+
+
+def _parse_coord_float(m, pos):
+    return _FLOAT32.unpack_from(m, pos)[0], pos + 4
+
+
+def _parse_coords_float(m, pos):
+    return _COORDS_FLOAT32.unpack_from(m, pos), pos + 12
+
+
+def _parse_coord_24bit(m, pos):
+    high, low = _COORD24.unpack_from(m, pos)
+    return high + low / 255, pos + 3
+
+
+def _parse_coords_24bit(m, pos):
+    x, pos = _parse_coord_24bit(m, pos)
+    y, pos = _parse_coord_24bit(m, pos)
+    z, pos = _parse_coord_24bit(m, pos)
+    return (x, y, z), pos
+
+
+def _parse_angle_int8(m, pos):
+    return m[pos] * math.pi / 128., pos + 1
+
+
+def _parse_angles_int8(m, pos):
+    x, y, z = _ANGLES_INT8.unpack_from(m, pos)
+    return (x * math.pi / 128., y * math.pi / 128., z * math.pi / 128.), pos + 3
+
+
+def _parse_angle_int16(m, pos):
+    return math.pi * _INT16.unpack_from(m, pos)[0] / 32768, pos + 2
+
+
+def _parse_angles_int16(m, pos):
+    x, y, z = _COORDS_INT16.unpack_from(m, pos)
+    return (math.pi * x / 32768, math.pi * y / 32768, math.pi * z / 32768), pos + 6
+
+
+def _parse_angle_float(m, pos):
+    return math.pi * _FLOAT32.unpack_from(m, pos)[0] / 180, pos + 4
+
+
+def _parse_angles_float(m, pos):
+    x, y, z = _COORDS_FLOAT32.unpack_from(m, pos)
+    return (math.pi * x / 180, math.pi * y / 180, math.pi * z / 180), pos + 12
+
+
 _DEFAULT_VIEW_HEIGHT = 22
 _DEFAULT_SOUND_PACKET_ATTENUATION = 1.0
 _DEFAULT_SOUND_PACKET_VOLUME = 255
 
 
-class ServerMessage:
+class _ServerMessageMeta(type):
+    """Gives each message class `__slots__` and an `__init__` generated from its `field_names`.
+
+    Messages are created in large numbers, so this keeps them free of a
+    `__dict__`, and has the constructor assign its arguments directly.  Fields
+    declared with `_EnumField` are stored in a slot named after the field with a
+    leading underscore.
+    """
+    def __new__(mcls, name, bases, namespace):
+        field_names = namespace.get('field_names')
+        if field_names is None:
+            namespace['__slots__'] = ()
+        else:
+            attrs = [mcls._field_attr(field_name, namespace, bases) for field_name in field_names]
+            inherited = {slot for base in bases for klass in base.__mro__
+                         for slot in klass.__dict__.get('__slots__', ())}
+            namespace['__slots__'] = tuple(attr for attr in attrs if attr not in inherited)
+            namespace['__init__'] = mcls._make_init(name, field_names, attrs)
+        return super().__new__(mcls, name, bases, namespace)
+
+    @staticmethod
+    def _field_attr(field_name, namespace, bases):
+        descriptor = namespace.get(field_name)
+        for base in bases:
+            if descriptor is None:
+                descriptor = getattr(base, field_name, None)
+        if isinstance(descriptor, _EnumField):
+            return '_' + field_name
+        return field_name
+
+    @staticmethod
+    def _make_init(name, field_names, attrs):
+        params = ", ".join(("self",) + tuple(field_names))
+        lines = [f"    self.{attr} = {field_name}" for field_name, attr in zip(field_names, attrs)] or ["    pass"]
+        code = f"def __init__({params}):\n" + "\n".join(lines) + "\n"
+        namespace = {}
+        exec(code, namespace)
+        init = namespace['__init__']
+        init.__qualname__ = f"{name}.__init__"
+        return init
+
+
+class ServerMessage(metaclass=_ServerMessageMeta):
     protocols = set(ProtocolVersion)
     field_names = None
 
-    @classmethod
-    @functools.lru_cache(None)
-    def _get_sig(cls):
-        return inspect.Signature([inspect.Parameter(n, inspect.Parameter.POSITIONAL_OR_KEYWORD)
-                                  for n in cls.field_names])
-
-    def __init__(self, *args, **kwargs):
-        bound_args = self._get_sig().bind(*args, **kwargs)
-        for key, val in bound_args.arguments.items():
-            setattr(self, key, val)
-
     def __repr__(self):
         return "{}({})".format(
                     self.__class__.__name__,
                     ", ".join("{}={!r}".format(k, getattr(self, k)) for k in self.field_names))
 
+    # The `_parse_*` helpers read from the buffer `m` starting at offset `pos`,
+    # and return the parsed value along with the offset just past it.  Walking
+    # a single buffer this way avoids copying the rest of the block each time
+    # a field is consumed.
+
     @classmethod
-    def _parse_struct(cls, fmt, m):
-        size = struct.calcsize(fmt)
-        return struct.unpack(fmt, m[:size]), m[size:]
+    def _parse_struct(cls, st, m, pos):
+        return st.unpack_from(m, pos), pos + st.size
 
     @classmethod
-    def _parse_string(cls, m):
-        if b'\0' not in m:
+    def _parse_string(cls, m, pos):
+        idx = m.find(b'\0', pos)
+        if idx < 0:
             raise MalformedNetworkData('Null terminator not found')
-        idx = m.index(b'\0')
-        return m[:idx].decode('latin'), m[idx + 1:]
+        return m[pos:idx].decode('latin'), idx + 1
 
     @classmethod
-    def _parse_bytes(cls, m):
-        if b'\0' not in m:
+    def _parse_bytes(cls, m, pos):
+        idx = m.find(b'\0', pos)
+        if idx < 0:
             raise MalformedNetworkData('Null terminator not found')
-        idx = m.index(b'\0')
-        return m[:idx], m[idx + 1:]
-
-    @classmethod
-    def _parse_angle(cls, m, protocol):
-        proto_flags = int(protocol.flags)
-        if proto_flags & int(ProtocolFlags.FLOATANGLE):
-            (angle,), m = cls._parse_struct("<f", m)
-            angle = math.pi * angle / 180
-        elif proto_flags & int(ProtocolFlags.SHORTANGLE):
-            (angle,), m = cls._parse_struct("<h", m)
-            angle = math.pi * angle / 32768
-        else:
-            angle, m = m[0], m[1:]
-            angle = angle * math.pi / 128.
-        return angle, m
-
-    @classmethod
-    def _parse_coord(cls, m, protocol):
-        proto_flags = int(protocol.flags)
-        if proto_flags & int(ProtocolFlags.FLOATCOORD):
-            (coord,), m = cls._parse_struct("<f", m)
-        elif proto_flags & int(ProtocolFlags.INT32COORD):
-            (coord,), m = cls._parse_struct("<i", m)
-            coord = coord / 16
-        elif proto_flags & int(ProtocolFlags._24BITCOORD):
-            high, low = cls._parsestruct("<hB", m)
-            coord = x1 + x2 / 255
-        else:
-            (coord,), m = cls._parse_struct("<h", m)
-            coord = coord / 8
-        return coord, m
+        return bytes(m[pos:idx]), idx + 1
 
     @classmethod
-    def _parse_angle_optional(cls, bit, flags, m, protocol):
-        if int(bit) & int(flags):
-            angle, m = cls._parse_angle(m, protocol)
+    def _parse_angle(cls, m, pos, protocol):
+        return protocol.parse_angle(m, pos)
+
+    @classmethod
+    def _parse_coord(cls, m, pos, protocol):
+        return protocol.parse_coord(m, pos)
+
+    @classmethod
+    def _parse_angle_optional(cls, bit, flags, m, pos, protocol):
+        if bit & flags:
+            angle, pos = protocol.parse_angle(m, pos)
         else:
             angle = None
-        return angle, m
+        return angle, pos
 
     @classmethod
-    def _parse_coord_optional(cls, bit, flags, m, protocol):
-        if int(bit) & int(flags):
-            coord, m = cls._parse_coord(m, protocol)
+    def _parse_coord_optional(cls, bit, flags, m, pos, protocol):
+        if bit & flags:
+            coord, pos = protocol.parse_coord(m, pos)
         else:
             coord = None
-        return coord, m
+        return coord, pos
 
     @classmethod
-    def _parse_tuple(cls, n, el_parser, m, protocol):
+    def _parse_tuple(cls, n, el_parser, m, pos, protocol):
         l = []
         for _ in range(n):
-            x, m = el_parser(m, protocol)
+            x, pos = el_parser(m, pos, protocol)
             l.append(x)
-        return tuple(l), m
+        return tuple(l), pos
 
     @classmethod
-    def _parse_angles(cls, m, protocol):
-        return cls._parse_tuple(3, cls._parse_angle, m, protocol)
+    def _parse_angles(cls, m, pos, protocol):
+        return protocol.parse_angles(m, pos)
 
     @classmethod
-    def _parse_coords(cls, m, protocol):
-        return cls._parse_tuple(3, cls._parse_coord, m, protocol)
+    def _parse_coords(cls, m, pos, protocol):
+        return protocol.parse_coords(m, pos)
 
     @classmethod
-    def _parse_optional(cls, bit, flags, fmt, m, post_func=None, default=None):
-        if int(bit) & int(flags):
-            (val,), m = cls._parse_struct(fmt, m)
+    def _parse_optional(cls, bit, flags, st, m, pos, post_func=None, default=None):
+        if bit & flags:
+            (val,), pos = cls._parse_struct(st, m, pos)
             if post_func:
                 val = post_func(val)
-            return val, m
+            return val, pos
         else:
-            return default, m
+            return default, pos
 
     @classmethod
-    def _parse_upper_byte(cls, bit, flags, lower_byte, m):
-        upper_byte, m = cls._parse_optional(bit, flags, "<B", m)
+    def _parse_upper_byte(cls, bit, flags, lower_byte, m, pos):
+        upper_byte, pos = cls._parse_optional(bit, flags, _UINT8, m, pos)
         if upper_byte is not None:
             if lower_byte is None:
                 raise MalformedNetworkData(f'Lower byte present but upper byte not present')
@@ -397,42 +643,93 @@ class ServerMessage:
             out = (upper_byte << 8) | lower_byte
         else:
             out = lower_byte
-        return out, m
+        return out, pos
 
     @classmethod
-    def parse_message(cls, m, protocol):
-        msg_type_int = m[0]
+    def _skip_string(cls, m, pos):
+        idx = m.find(b'\0', pos)
+        if idx < 0:
+            raise MalformedNetworkData('Null terminator not found')
+        return idx + 1
 
-        if msg_type_int & int(_UpdateFlags.SIGNAL):
-            msg_cls = ServerMessageUpdate
-        else:
-            try:
-                msg_type = ServerMessageType(msg_type_int)
-            except ValueError:
-                raise MalformedNetworkData("Invalid message type {}".format(msg_type_int))
+    @classmethod
+    def _coord_size(cls, protocol):
+        return protocol.coord_size
+
+    @classmethod
+    def _angle_size(cls, protocol):
+        return protocol.angle_size
 
-            try:
-                msg_cls = _MESSAGE_CLASSES[msg_type]
-            except KeyError:
-                raise MalformedNetworkData("No handler for message type {}".format(msg_type))
+    @classmethod
+    def _lookup_message_class(cls, m, pos, protocol):
+        """Find the class of the message starting at offset `pos` of the buffer `m`.
+
+        Returns the class and the offset at which the message body starts.
+        """
+        msg_type_int = m[pos]
+
+        table = _message_class_table(None) if protocol is None else protocol.message_classes
+        msg_cls = table[msg_type_int]
+        if msg_cls is None:
+            cls._raise_bad_message_type(msg_type_int, protocol)
 
-            if protocol is not None and protocol.version not in msg_cls.protocols:
-                raise MalformedNetworkData(f"Received {msg_type} message but protocol is {protocol.version}")
+        if msg_cls is not ServerMessageUpdate:
+            pos += 1
+
+        return msg_cls, pos
+
+    @classmethod
+    def _raise_bad_message_type(cls, msg_type_int, protocol):
+        try:
+            msg_type = ServerMessageType(msg_type_int)
+        except ValueError:
+            raise MalformedNetworkData("Invalid message type {}".format(msg_type_int))
 
-            m = m[1:]
+        if msg_type not in _MESSAGE_CLASSES:
+            raise MalformedNetworkData("No handler for message type {}".format(msg_type))
 
-        return msg_cls.parse(m, protocol)
+        raise MalformedNetworkData(f"Received {msg_type} message but protocol is {protocol.version}")
 
     @classmethod
-    def parse(cls, m, protocol):
+    def parse_message_from(cls, m, pos, protocol):
+        """Parse the message starting at offset `pos` of the buffer `m`.
+
+        Returns the parsed message and the offset of the byte following it.
+        """
+        msg_cls, pos = cls._lookup_message_class(m, pos, protocol)
+        return msg_cls.parse(m, pos, protocol)
+
+    @classmethod
+    def parse_message(cls, m, protocol):
+        msg, pos = cls.parse_message_from(m, 0, protocol)
+        return msg, m[pos:]
+
+    @classmethod
+    def parse(cls, m, pos, protocol):
         raise NotImplementedError
 
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        """Return the offset just past the message body at `pos`, without building the message.
+
+        Subclasses override this where the size can be worked out more cheaply than by parsing.
+        """
+        return cls.parse(m, pos, protocol)[1]
+
 
 class StructServerMessage(ServerMessage):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._struct = struct.Struct(cls.fmt)
+
+    @classmethod
+    def parse(cls, m, pos, protocol):
+        st = cls._struct
+        return cls(*st.unpack_from(m, pos)), pos + st.size
+
     @classmethod
-    def parse(cls, m, protocol):
-        vals, m = cls._parse_struct(cls.fmt, m)
-        return cls(**dict(zip(cls.field_names, vals))), m
+    def skip(cls, m, pos, protocol):
+        return pos + cls._struct.size
 
 
 class ServerMessageUpdate(ServerMessage):
@@ -450,51 +747,51 @@ class ServerMessageUpdate(ServerMessage):
     )
 
     _size_cache = {}
-    _msg_cache = {}
+    _msg_cache = _LRUCache(maxsize=65536)
 
     @classmethod
     def clear_cache(cls):
         cls._size_cache = {}
-        cls._msg_cache = {}
+        cls._msg_cache.clear()
 
     @classmethod
-    def _parse_flags_fast(cls, m, protocol):
+    def _parse_flags_fast(cls, m, pos, protocol):
         """Parse out flags but for efficiency don't convert to enum types.
 
         In addition test against numbers rather than enum values to avoid the extra lookups.
         """
-        flags = m[0]
-        n = 1
+        flags = m[pos]
+        pos += 1
         if flags & 1: # MOREBITS
-            flags |= (m[n] << 8)
-            n += 1
+            flags |= (m[pos] << 8)
+            pos += 1
             if flags & (1 << 15):  # EXTEND1
-                flags |= m[n] << 16
-                n += 1
+                flags |= m[pos] << 16
+                pos += 1
                 if flags & (1 << 23): # EXTEND2
-                    flags |= m[n] << 24
-                    n += 1
-        return flags, m[n:]
+                    flags |= m[pos] << 24
+                    pos += 1
+        return flags, pos
 
     @classmethod
-    def _parse_flags_safe(cls, m, protocol):
-        """Like _parse_flags_fast but converts to enum type and does some checks.
+    def _parse_flags_safe(cls, m, pos, protocol):
+        """Like _parse_flags_fast but does some checks.
 
         Used when a cache miss occurs to check that _parse_flags_fast is returning the same value.
         """
-        flags, m = _UpdateFlags(m[0]), m[1:]
-        assert flags & _UpdateFlags.SIGNAL
+        flags, pos = m[pos], pos + 1
+        assert flags & _UPDATE_FLAGS.SIGNAL
 
-        if flags & _UpdateFlags.MOREBITS:
-            more_flags, m = m[0], m[1:]
+        if flags & _UPDATE_FLAGS.MOREBITS:
+            more_flags, pos = m[pos], pos + 1
             flags |= (more_flags << 8)
 
         if protocol.version != ProtocolVersion.NETQUAKE:
-            if flags & _UpdateFlags.EXTEND1:
-                extend1_flags, m = m[0], m[1:]
+            if flags & _UPDATE_FLAGS.EXTEND1:
+                extend1_flags, pos = m[pos], pos + 1
                 flags |= extend1_flags << 16
-            if flags & _UpdateFlags.EXTEND2:
-                extend2_flags, m = m[0], m[1:]
+            if flags & _UPDATE_FLAGS.EXTEND2:
+                extend2_flags, pos = m[pos], pos + 1
                 flags |= extend2_flags << 24
         else:
             if flags & (1 << 15):   # U_TRANS
@@ -502,42 +799,42 @@ class ServerMessageUpdate(ServerMessage):
                 # protocol 15.  We don't support it yet, but could do.
                 raise UnsupportedProtocol('Nehahra not supported')
 
-            fq_flags = flags & _UpdateFlags.fitzquake_flags()
+            fq_flags = flags & _UPDATE_FLAGS.FITZQUAKE
             if fq_flags:
-                raise MalformedNetworkData(f'{fq_flags} passed but protocol is {protocol}')
+                raise MalformedNetworkData(f'{_UpdateFlags(fq_flags)} passed but protocol is {protocol}')
 
-        return flags, m
+        return flags, pos
 
     @classmethod
-    def _parse_no_cache(cls, flags, m, protocol):
-        (entity_num,), m = cls._parse_struct("<H" if flags & _UpdateFlags.LONGENTITY else "<B", m)
-        model_num, m = cls._parse_optional(_UpdateFlags.MODEL, flags, "<B", m)
-        frame, m = cls._parse_optional(_UpdateFlags.FRAME, flags, "<B", m)
-        colormap, m = cls._parse_optional(_UpdateFlags.COLORMAP, flags, "<B", m)
-        skin, m = cls._parse_optional(_UpdateFlags.SKIN, flags, "<B", m)
-        effects, m = cls._parse_optional(_UpdateFlags.EFFECTS, flags, "<B", m)
+    def _parse_no_cache(cls, flags, m, pos, protocol):
+        (entity_num,), pos = cls._parse_struct(_UINT16 if flags & _UPDATE_FLAGS.LONGENTITY else _UINT8, m, pos)
+        model_num, pos = cls._parse_optional(_UPDATE_FLAGS.MODEL, flags, _UINT8, m, pos)
+        frame, pos = cls._parse_optional(_UPDATE_FLAGS.FRAME, flags, _UINT8, m, pos)
+        colormap, pos = cls._parse_optional(_UPDATE_FLAGS.COLORMAP, flags, _UINT8, m, pos)
+        skin, pos = cls._parse_optional(_UPDATE_FLAGS.SKIN, flags, _UINT8, m, pos)
+        effects, pos = cls._parse_optional(_UPDATE_FLAGS.EFFECTS, flags, _UINT8, m, pos)
 
         fix_coord = lambda c: c / 8.
         fix_angle = lambda a: a * math.pi / 128.
 
-        origin1, m = cls._parse_coord_optional(_UpdateFlags.ORIGIN1, flags, m, protocol)
-        angle1, m = cls._parse_angle_optional(_UpdateFlags.ANGLE1, flags, m, protocol)
-        origin2, m = cls._parse_coord_optional(_UpdateFlags.ORIGIN2, flags, m, protocol)
-        angle2, m = cls._parse_angle_optional(_UpdateFlags.ANGLE2, flags, m, protocol)
-        origin3, m = cls._parse_coord_optional(_UpdateFlags.ORIGIN3, flags, m, protocol)
-        angle3, m = cls._parse_angle_optional(_UpdateFlags.ANGLE3, flags, m, protocol)
+        origin1, pos = cls._parse_coord_optional(_UPDATE_FLAGS.ORIGIN1, flags, m, pos, protocol)
+        angle1, pos = cls._parse_angle_optional(_UPDATE_FLAGS.ANGLE1, flags, m, pos, protocol)
+        origin2, pos = cls._parse_coord_optional(_UPDATE_FLAGS.ORIGIN2, flags, m, pos, protocol)
+        angle2, pos = cls._parse_angle_optional(_UPDATE_FLAGS.ANGLE2, flags, m, pos, protocol)
+        origin3, pos = cls._parse_coord_optional(_UPDATE_FLAGS.ORIGIN3, flags, m, pos, protocol)
+        angle3, pos = cls._parse_angle_optional(_UPDATE_FLAGS.ANGLE3, flags, m, pos, protocol)
         origin = (origin1, origin2, origin3)
         angle = (angle1, angle2, angle3)
 
         if protocol.version != ProtocolVersion.NETQUAKE:
             # TODO: Store alpha / scale / lerpfinish
-            alpha, m = cls._parse_optional(_UpdateFlags.ALPHA, flags, "<B", m)
-            scale, m = cls._parse_optional(_UpdateFlags.SCALE, flags, "<B", m)
-            frame, m = cls._parse_upper_byte(_UpdateFlags.FRAME2, flags, frame, m)
-            model_num, m = cls._parse_upper_byte(_UpdateFlags.MODEL2, flags, model_num, m)
-            lerp_finish, m = cls._parse_optional(_UpdateFlags.LERPFINISH, flags, "<B", m)
+            alpha, pos = cls._parse_optional(_UPDATE_FLAGS.ALPHA, flags, _UINT8, m, pos)
+            scale, pos = cls._parse_optional(_UPDATE_FLAGS.SCALE, flags, _UINT8, m, pos)
+            frame, pos = cls._parse_upper_byte(_UPDATE_FLAGS.FRAME2, flags, frame, m, pos)
+            model_num, pos = cls._parse_upper_byte(_UPDATE_FLAGS.MODEL2, flags, model_num, m, pos)
+            lerp_finish, pos = cls._parse_optional(_UPDATE_FLAGS.LERPFINISH, flags, _UINT8, m, pos)
 
-        step = bool(flags & _UpdateFlags.STEP)
+        step = bool(flags & _UPDATE_FLAGS.STEP)
 
         return cls(entity_num,
                    model_num,
@@ -547,34 +844,49 @@ class ServerMessageUpdate(ServerMessage):
                    effects,
                    origin,
                    angle,
-                   step), m, flags
+                   step), pos, flags
 
     @classmethod
-    def parse(cls, m, protocol):
-        int_flags, m_after_flags = cls._parse_flags_fast(m, protocol)
+    def parse(cls, m, pos, protocol):
+        int_flags, pos_after_flags = cls._parse_flags_fast(m, pos, protocol)
 
-        msg = None
         size = cls._size_cache.get(int_flags)
         if size is not None:
-            msg = cls._msg_cache.get(m[:size])
+            msg = cls._msg_cache.get(m[pos:pos + size])
+        else:
+            msg = None
+            cls._msg_cache.misses += 1
 
         if msg is None:
-            flags, _ = cls._parse_flags_safe(m, protocol)
+            flags, _ = cls._parse_flags_safe(m, pos, protocol)
             assert flags == int_flags, f"flags={flags} int_flags={int_flags}"
-            msg, m_after, flags = cls._parse_no_cache(flags, m_after_flags, protocol)
-            size = len(m) - len(m_after)
+            msg, pos_after, flags = cls._parse_no_cache(flags, m, pos_after_flags, protocol)
+            size = pos_after - pos
             cls._size_cache[flags] = size
-            cls._msg_cache[m[:size]] = msg
+            cls._msg_cache.put(m[pos:pos_after], msg)
+
+        return msg, pos + size
 
-        return msg, m[size:]
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        int_flags, _ = cls._parse_flags_fast(m, pos, protocol)
+        size = cls._size_cache.get(int_flags)
+        if size is None:
+            # The size only depends on the flags, so parse one message to learn it.
+            return cls.parse(m, pos, protocol)[1]
+        return pos + size
 
 
 class NoFieldsServerMessage(ServerMessage):
     field_names = ()
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls(), m
+    def parse(cls, m, pos, protocol):
+        return cls(), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return pos
 
 
 @_register_server_message
@@ -599,10 +911,12 @@ class ServerMessageFog(ServerMessage):
     protocols = {ProtocolVersion.FITZQUAKE}
     msg_type = ServerMessageType.FOG
 
+    _struct = struct.Struct("<BBBBH")
+
     @classmethod
-    def parse(cls, m, protocol):
-        (density, r, g, b, time_short), m = cls._parse_struct("<BBBBH", m)
-        return cls(density, (r, g, b), time_short / 100.), m
+    def parse(cls, m, pos, protocol):
+        (density, r, g, b, time_short), pos = cls._parse_struct(cls._struct, m, pos)
+        return cls(density, (r, g, b), time_short / 100.), pos
 
 
 @_register_server_message
@@ -611,9 +925,13 @@ class ServerMessagePrint(ServerMessage):
     msg_type = ServerMessageType.PRINT
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 @_register_server_message
@@ -622,9 +940,13 @@ class ServerMessageCenterPrint(ServerMessage):
     msg_type = ServerMessageType.CENTERPRINT
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 @_register_server_message
@@ -633,9 +955,13 @@ class ServerMessageCutScene(ServerMessage):
     msg_type = ServerMessageType.CUTSCENE
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 @_register_server_message
@@ -644,34 +970,47 @@ class ServerMessageStuffText(ServerMessage):
     msg_type = ServerMessageType.STUFFTEXT
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 @_register_server_message
 class ServerMessageSkybox(ServerMessage):
     protocols = {ProtocolVersion.FITZQUAKE}
-    name = ('string',)
+    field_names = ('string',)
     msg_type = ServerMessageType.SKYBOX
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 class _SpawnStaticSoundBase(ServerMessage):
     field_names = ("origin", "sound_num", "vol", "atten")
 
+    _structs = {1: struct.Struct("<BBB"), 2: struct.Struct("<HBB")}
+
     @classmethod
-    def _parse_generic(cls, m, protocol, version):
-        origin, m = cls._parse_coords(m, protocol)
+    def _parse_generic(cls, m, pos, protocol, version):
+        origin, pos = cls._parse_coords(m, pos, protocol)
+
+        (sound_num, vol, atten), pos = cls._parse_struct(cls._structs[version], m, pos)
 
-        fmt = "<HBB" if version == 2 else "<BBB"
-        (sound_num, vol, atten), m = cls._parse_struct(fmt, m)
+        return cls(origin, sound_num, vol, atten), pos
 
-        return cls(origin, sound_num, vol, atten), m
+    @classmethod
+    def _skip_generic(cls, m, pos, protocol, version):
+        return pos + 3 * cls._coord_size(protocol) + cls._structs[version].size
 
 
 @_register_server_message
@@ -679,8 +1018,12 @@ class ServerMessageSpawnStaticSound(_SpawnStaticSoundBase):
     msg_type = ServerMessageType.SPAWNSTATICSOUND
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, 1)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, 1)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, 1)
 
 
 @_register_server_message
@@ -688,8 +1031,12 @@ class ServerMessageSpawnStaticSound2(_SpawnStaticSoundBase):
     msg_type = ServerMessageType.SPAWNSTATICSOUND2
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, 2)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, 2)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, 2)
 
 
 @_register_server_message
@@ -721,37 +1068,59 @@ class ServerMessageSetPause(StructServerMessage):
 
 
 class _SpawnBaselineBase(ServerMessage):
+    _struct_v1 = struct.Struct("<BBBB")
+    # Version 2 model and frame fields are one or two bytes wide depending on the
+    # large model / large frame bits.
+    _structs_v2 = {bits: struct.Struct(f"{'H' if bits & _BASELINE_BITS.LARGEMODEL else 'B'}"
+                                       f"{'H' if bits & _BASELINE_BITS.LARGEFRAME else 'B'}"
+                                       "BB")
+                   for bits in range(4)}
+
     @classmethod
-    def _parse_generic(cls, m, protocol, include_entity_num, version):
+    def _parse_generic(cls, m, pos, protocol, include_entity_num, version):
         if include_entity_num:
-            (entity_num,), m = cls._parse_struct("<H", m)
+            (entity_num,), pos = cls._parse_struct(_UINT16, m, pos)
 
         if version == 2:
-            (bits,), m = cls._parse_struct("<B", m)
-            bits = _BaselineBits(bits)
-            fmt = (f"{'H' if bits & _BaselineBits.LARGEMODEL else 'B'}"
-                   f"{'H' if bits & _BaselineBits.LARGEFRAME else 'B'}"
-                   "BB")
+            (bits,), pos = cls._parse_struct(_UINT8, m, pos)
+            st = cls._structs_v2[bits & (_BASELINE_BITS.LARGEMODEL | _BASELINE_BITS.LARGEFRAME)]
         else:
-            bits = _BaselineBits(0)
-            fmt = "<BBBB"
+            bits = 0
+            st = cls._struct_v1
 
-        (model_num, frame, colormap, skin), m = cls._parse_struct(fmt, m)
+        (model_num, frame, colormap, skin), pos = cls._parse_struct(st, m, pos)
         origin, angles = [], []
         for _ in range(3):
-            o, m = cls._parse_coord(m, protocol)
-            a, m = cls._parse_angle(m, protocol)
+            o, pos = cls._parse_coord(m, pos, protocol)
+            a, pos = cls._parse_angle(m, pos, protocol)
             origin.append(o)
             angles.append(a)
 
-        if bits & _BaselineBits.ALPHA:
+        if bits & _BASELINE_BITS.ALPHA:
             # TODO: Store alpha
-            (alpha,), m = cls._parse_struct("<B", m)
+            (alpha,), pos = cls._parse_struct(_UINT8, m, pos)
 
         if include_entity_num:
-            return cls(entity_num, model_num, frame, colormap, skin, tuple(origin), tuple(angles)), m
+            return cls(entity_num, model_num, frame, colormap, skin, tuple(origin), tuple(angles)), pos
         else:
-            return cls(model_num, frame, colormap, skin, tuple(origin), tuple(angles)), m
+            return cls(model_num, frame, colormap, skin, tuple(origin), tuple(angles)), pos
+
+    @classmethod
+    def _skip_generic(cls, m, pos, protocol, include_entity_num, version):
+        if include_entity_num:
+            pos += 2
+
+        if version == 2:
+            bits, pos = m[pos], pos + 1
+            st = cls._structs_v2[bits & (_BASELINE_BITS.LARGEMODEL | _BASELINE_BITS.LARGEFRAME)]
+        else:
+            bits = 0
+            st = cls._struct_v1
+
+        pos += st.size + 3 * (cls._coord_size(protocol) + cls._angle_size(protocol))
+        if bits & _BASELINE_BITS.ALPHA:
+            pos += 1
+        return pos
 
 
 @_register_server_message
@@ -760,8 +1129,12 @@ class ServerMessageSpawnBaseline(_SpawnBaselineBase):
     msg_type = ServerMessageType.SPAWNBASELINE
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, True, 1)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, True, 1)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, True, 1)
 
 
 @_register_server_message
@@ -771,8 +1144,12 @@ class ServerMessageSpawnBaseline2(_SpawnBaselineBase):
     msg_type = ServerMessageType.SPAWNBASELINE2
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, True, 2)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, True, 2)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, True, 2)
 
 
 @_register_server_message
@@ -781,8 +1158,12 @@ class ServerMessageSpawnStatic(_SpawnBaselineBase):
     msg_type = ServerMessageType.SPAWNSTATIC
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, False, 1)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, False, 1)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, False, 1)
 
 
 @_register_server_message
@@ -792,8 +1173,12 @@ class ServerMessageSpawnStatic2(_SpawnBaselineBase):
     msg_type = ServerMessageType.SPAWNSTATIC2
 
     @classmethod
-    def parse(cls, m, protocol):
-        return cls._parse_generic(m, protocol, False, 2)
+    def parse(cls, m, pos, protocol):
+        return cls._parse_generic(m, pos, protocol, False, 2)
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_generic(m, pos, protocol, False, 2)
 
 
 @_register_server_message
@@ -809,10 +1194,14 @@ class ServerMessageUpdateName(ServerMessage):
     field_names = ('client_num', 'name')
 
     @classmethod
-    def parse(cls, m, protocol):
-        client_num, m = m[0], m[1:]
-        name, m = cls._parse_string(m)
-        return cls(client_num, name), m
+    def parse(cls, m, pos, protocol):
+        client_num, pos = m[pos], pos + 1
+        name, pos = cls._parse_string(m, pos)
+        return cls(client_num, name), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos + 1)
 
 
 @_register_server_message
@@ -835,10 +1224,14 @@ class ServerMessageLightStyle(ServerMessage):
     msg_type = ServerMessageType.LIGHTSTYLE
 
     @classmethod
-    def parse(cls, m, protocol):
-        index, m = m[0], m[1:]
-        style, m = cls._parse_string(m)
-        return cls(index, style), m
+    def parse(cls, m, pos, protocol):
+        index, pos = m[pos], pos + 1
+        style, pos = cls._parse_string(m, pos)
+        return cls(index, style), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos + 1)
 
 
 @_register_server_message
@@ -854,9 +1247,13 @@ class ServerMessageSetAngle(ServerMessage):
     msg_type = ServerMessageType.SETANGLE
 
     @classmethod
-    def parse(cls, m, protocol):
-        view_angles, m = cls._parse_angles(m, protocol)
-        return cls(view_angles), m
+    def parse(cls, m, pos, protocol):
+        view_angles, pos = cls._parse_angles(m, pos, protocol)
+        return cls(view_angles), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return pos + 3 * cls._angle_size(protocol)
 
 
 @_register_server_message
@@ -864,35 +1261,37 @@ class ServerMessageServerInfo(ServerMessage):
     field_names = ('protocol', 'max_clients', 'game_type', 'level_name', 'models', 'sounds')
     msg_type = ServerMessageType.SERVERINFO
 
+    _struct_clients = struct.Struct("<BB")
+
     @classmethod
-    def _parse_string_list(cls, m):
+    def _parse_string_list(cls, m, pos):
         l = []
         while True:
-            s, m = cls._parse_string(m)
+            s, pos = cls._parse_string(m, pos)
             if not s:
                 break
             l.append(s)
-        return l, m
+        return l, pos
 
     @classmethod
-    def parse(cls, m, protocol):
-        (protocol_version,), m = cls._parse_struct("<I", m)
+    def parse(cls, m, pos, protocol):
+        (protocol_version,), pos = cls._parse_struct(_UINT32, m, pos)
         protocol_version = ProtocolVersion(protocol_version)
 
         if protocol_version == ProtocolVersion.RMQ:
-            (protocol_flags,), m = cls._parse_struct("<I", m)
+            (protocol_flags,), pos = cls._parse_struct(_UINT32, m, pos)
             protocol_flags = ProtocolFlags(protocol_flags)
         else:
             protocol_flags = ProtocolFlags(0)
 
         next_protocol = Protocol(protocol_version, protocol_flags)
 
-        (max_clients, game_type), m = cls._parse_struct("<BB", m)
-        level_name, m = cls._parse_string(m)
-        models, m = cls._parse_string_list(m)
-        sounds, m = cls._parse_string_list(m)
+        (max_clients, game_type), pos = cls._parse_struct(cls._struct_clients, m, pos)
+        level_name, pos = cls._parse_string(m, pos)
+        models, pos = cls._parse_string_list(m, pos)
+        sounds, pos = cls._parse_string_list(m, pos)
 
-        return cls(next_protocol, max_clients, game_type, level_name, models, sounds), m
+        return cls(next_protocol, max_clients, game_type, level_name, models, sounds), pos
 
 
 @_register_server_message
@@ -918,65 +1317,78 @@ class ServerMessageClientData(ServerMessage):
     )
     msg_type = ServerMessageType.CLIENTDATA
 
+    items = _EnumField(ItemFlags)
+    active_weapon = _EnumField(ItemFlags)
+
+    _struct_stats = struct.Struct("<HBBBBBB")
+
+    _pre_items_bits = int(_CLIENT_DATA_FLAGS.VIEWHEIGHT | _CLIENT_DATA_FLAGS.IDEALPITCH |
+                          _CLIENT_DATA_FLAGS.PUNCH1 | _CLIENT_DATA_FLAGS.PUNCH2 | _CLIENT_DATA_FLAGS.PUNCH3 |
+                          _CLIENT_DATA_FLAGS.VELOCITY1 | _CLIENT_DATA_FLAGS.VELOCITY2 | _CLIENT_DATA_FLAGS.VELOCITY3)
+    _post_items_bits = int(_CLIENT_DATA_FLAGS.WEAPONFRAME | _CLIENT_DATA_FLAGS.ARMOR | _CLIENT_DATA_FLAGS.WEAPON)
+    _fitzquake_byte_bits = int(_CLIENT_DATA_FLAGS.WEAPON2 | _CLIENT_DATA_FLAGS.ARMOR2 | _CLIENT_DATA_FLAGS.AMMO2 |
+                               _CLIENT_DATA_FLAGS.SHELLS2 | _CLIENT_DATA_FLAGS.NAILS2 | _CLIENT_DATA_FLAGS.ROCKETS2 |
+                               _CLIENT_DATA_FLAGS.CELLS2 | _CLIENT_DATA_FLAGS.WEAPONFRAME2 |
+                               _CLIENT_DATA_FLAGS.WEAPONALPHA)
+
     @classmethod
-    def parse(cls, m, protocol):
-        (flags_int,), m = cls._parse_struct("<H", m)
-        flags = _ClientDataFlags(flags_int)
+    def parse(cls, m, pos, protocol):
+        (flags,), pos = cls._parse_struct(_UINT16, m, pos)
 
         if protocol.version != ProtocolVersion.NETQUAKE:
-            if flags & _ClientDataFlags.EXTEND1:
-                extend1_flags, m = m[0], m[1:]
+            if flags & _CLIENT_DATA_FLAGS.EXTEND1:
+                extend1_flags, pos = m[pos], pos + 1
                 flags |= extend1_flags << 16
-            if flags & _ClientDataFlags.EXTEND2:
-                extend1_flags, m = m[0], m[1:]
+            if flags & _CLIENT_DATA_FLAGS.EXTEND2:
+                extend1_flags, pos = m[pos], pos + 1
                 flags |= extend1_flags << 24
         else:
-            fq_flags = flags & _ClientDataFlags.fitzquake_flags()
+            fq_flags = flags & _CLIENT_DATA_FLAGS.FITZQUAKE
             if fq_flags:
-                raise MalformedNetworkData(f'{fq_flags} passed but protocol is {protocol}')
+                raise MalformedNetworkData(f'{_ClientDataFlags(fq_flags)} passed but protocol is {protocol}')
 
-        view_height, m = cls._parse_optional(_ClientDataFlags.VIEWHEIGHT, flags, "<B", m,
-                                             default=_DEFAULT_VIEW_HEIGHT)
-        ideal_pitch, m = cls._parse_optional(_ClientDataFlags.IDEALPITCH, flags, "<B", m, default=0)
+        view_height, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.VIEWHEIGHT, flags, _UINT8, m, pos,
+                                               default=_DEFAULT_VIEW_HEIGHT)
+        ideal_pitch, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.IDEALPITCH, flags, _UINT8, m, pos, default=0)
 
         fix_velocity = lambda v: v * 16
-        punch1, m = cls._parse_optional(_ClientDataFlags.PUNCH1, flags, "<B", m, default=0)
-        m_velocity1, m = cls._parse_optional(_ClientDataFlags.VELOCITY1, flags, "<b", m, fix_velocity,
-                                             default=0)
-        punch2, m = cls._parse_optional(_ClientDataFlags.PUNCH2, flags, "<B", m, default=0)
-        m_velocity2, m = cls._parse_optional(_ClientDataFlags.VELOCITY2, flags, "<b", m, fix_velocity,
-                                             default=0)
-        punch3, m = cls._parse_optional(_ClientDataFlags.PUNCH3, flags, "<B", m, default=0)
-        m_velocity3, m = cls._parse_optional(_ClientDataFlags.VELOCITY3, flags, "<b", m, fix_velocity,
-                                             default=0)
+        punch1, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.PUNCH1, flags, _UINT8, m, pos, default=0)
+        m_velocity1, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.VELOCITY1, flags, _INT8, m, pos, fix_velocity,
+                                               default=0)
+        punch2, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.PUNCH2, flags, _UINT8, m, pos, default=0)
+        m_velocity2, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.VELOCITY2, flags, _INT8, m, pos, fix_velocity,
+                                               default=0)
+        punch3, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.PUNCH3, flags, _UINT8, m, pos, default=0)
+        m_velocity3, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.VELOCITY3, flags, _INT8, m, pos, fix_velocity,
+                                               default=0)
         punch_angles = (punch1, punch2, punch3)
         m_velocity = (m_velocity1, m_velocity2, m_velocity3)
 
-        (items_int,), m = cls._parse_struct("<I", m)
-        items = ItemFlags(items_int)
+        (items,), pos = cls._parse_struct(_UINT32, m, pos)
 
-        on_ground = bool(flags & _ClientDataFlags.ONGROUND)
-        in_water = bool(flags & _ClientDataFlags.INWATER)
+        on_ground = bool(flags & _CLIENT_DATA_FLAGS.ONGROUND)
+        in_water = bool(flags & _CLIENT_DATA_FLAGS.INWATER)
 
-        weapon_frame, m = cls._parse_optional(_ClientDataFlags.WEAPONFRAME, flags, "<B", m, default=0)
-        armor, m = cls._parse_optional(_ClientDataFlags.ARMOR, flags, "<B", m, default=0)
-        weapon_model_index, m = cls._parse_optional(_ClientDataFlags.WEAPON, flags, "<B", m, default=0)
+        weapon_frame, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.WEAPONFRAME, flags, _UINT8, m, pos, default=0)
+        armor, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.ARMOR, flags, _UINT8, m, pos, default=0)
+        weapon_model_index, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.WEAPON, flags, _UINT8, m, pos, default=0)
 
-        (health, ammo, shells, nails, rockets, cells, active_weapon), m = cls._parse_struct("<HBBBBBB", m)
-        active_weapon = ItemFlags(active_weapon)
+        (health, ammo, shells, nails, rockets, cells, active_weapon), pos = cls._parse_struct(cls._struct_stats,
+                                                                                            m, pos)
 
         if protocol.version != ProtocolVersion.NETQUAKE:
-            weapon_model_index, m = cls._parse_upper_byte(_ClientDataFlags.WEAPON2, flags, weapon_model_index, m)
-            armor, m = cls._parse_upper_byte(_ClientDataFlags.ARMOR2, flags, armor, m)
-            ammo, m = cls._parse_upper_byte(_ClientDataFlags.AMMO2, flags, ammo, m)
-            shells, m = cls._parse_upper_byte(_ClientDataFlags.SHELLS2, flags, shells, m)
-            nails, m = cls._parse_upper_byte(_ClientDataFlags.NAILS2, flags, nails, m)
-            rockets, m = cls._parse_upper_byte(_ClientDataFlags.ROCKETS2, flags, rockets, m)
-            cells, m = cls._parse_upper_byte(_ClientDataFlags.CELLS2, flags, cells, m)
-            weapon_frame, m = cls._parse_upper_byte(_ClientDataFlags.WEAPONFRAME2, flags, weapon_frame, m)
+            weapon_model_index, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.WEAPON2, flags, weapon_model_index,
+                                                            m, pos)
+            armor, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.ARMOR2, flags, armor, m, pos)
+            ammo, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.AMMO2, flags, ammo, m, pos)
+            shells, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.SHELLS2, flags, shells, m, pos)
+            nails, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.NAILS2, flags, nails, m, pos)
+            rockets, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.ROCKETS2, flags, rockets, m, pos)
+            cells, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.CELLS2, flags, cells, m, pos)
+            weapon_frame, pos = cls._parse_upper_byte(_CLIENT_DATA_FLAGS.WEAPONFRAME2, flags, weapon_frame, m, pos)
 
             # TODO: Store weapon alpha
-            weapon_alpha, m = cls._parse_optional(_ClientDataFlags.WEAPONALPHA, flags, "<B", m)
+            weapon_alpha, pos = cls._parse_optional(_CLIENT_DATA_FLAGS.WEAPONALPHA, flags, _UINT8, m, pos)
 
         return cls(
             view_height,
@@ -996,7 +1408,30 @@ class ServerMessageClientData(ServerMessage):
             rockets,
             cells,
             active_weapon
-        ), m
+        ), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        (flags,), body_pos = cls._parse_struct(_UINT16, m, pos)
+
+        if protocol.version != ProtocolVersion.NETQUAKE:
+            if flags & _CLIENT_DATA_FLAGS.EXTEND1:
+                flags |= m[body_pos] << 16
+                body_pos += 1
+            if flags & _CLIENT_DATA_FLAGS.EXTEND2:
+                flags |= m[body_pos] << 24
+                body_pos += 1
+            fq_bytes = _popcount(flags & cls._fitzquake_byte_bits)
+        elif flags & _CLIENT_DATA_FLAGS.FITZQUAKE:
+            # Let the full parser raise the appropriate error.
+            return cls.parse(m, pos, protocol)[1]
+        else:
+            fq_bytes = 0
+
+        # Optional bytes before and after the items field, the items field, then
+        # health/ammo/shells/nails/rockets/cells/active weapon.
+        return (body_pos + _popcount(flags & cls._pre_items_bits) + 4 +
+                _popcount(flags & cls._post_items_bits) + cls._struct_stats.size + fq_bytes)
 
 
 @_register_server_message
@@ -1004,31 +1439,48 @@ class ServerMessageSound(ServerMessage):
     field_names = ('volume', 'attenuation', 'entity_num', 'channel', 'sound_num', 'pos')
     msg_type = ServerMessageType.SOUND
 
+    _struct_large_entity = struct.Struct("<HB")
+
     @classmethod
-    def parse(cls, m, protocol):
-        flags, m = _SoundFlags(m[0]), m[1:]
+    def parse(cls, m, pos, protocol):
+        flags, pos = m[pos], pos + 1
 
-        volume, m = cls._parse_optional(_SoundFlags.VOLUME, flags, "<B", m,
-                                        default=_DEFAULT_SOUND_PACKET_VOLUME)
-        attenuation, m = cls._parse_optional(_SoundFlags.ATTENUATION, flags, "<B", m, lambda b: b / 64.,
-                                             default=_DEFAULT_SOUND_PACKET_ATTENUATION)
+        volume, pos = cls._parse_optional(_SOUND_FLAGS.VOLUME, flags, _UINT8, m, pos,
+                                          default=_DEFAULT_SOUND_PACKET_VOLUME)
+        attenuation, pos = cls._parse_optional(_SOUND_FLAGS.ATTENUATION, flags, _UINT8, m, pos, lambda b: b / 64.,
+                                               default=_DEFAULT_SOUND_PACKET_ATTENUATION)
 
         if protocol.version == ProtocolVersion.NETQUAKE:
-            fq_flags = flags & _SoundFlags.fitzquake_flags()
+            fq_flags = flags & _SOUND_FLAGS.FITZQUAKE
             if fq_flags:
-                raise MalformedNetworkData(f'{fq_flags} passed but protocol is {protocol}')
+                raise MalformedNetworkData(f'{_SoundFlags(fq_flags)} passed but protocol is {protocol}')
 
-        if flags & _SoundFlags.LARGEENTITY:
-            (ent, channel), m = cls._parse_struct("<HB", m)
+        if flags & _SOUND_FLAGS.LARGEENTITY:
+            (ent, channel), pos = cls._parse_struct(cls._struct_large_entity, m, pos)
         else:
-            (t,), m = cls._parse_struct("<H", m)
+            (t,), pos = cls._parse_struct(_UINT16, m, pos)
             entity_num = t >> 3
             channel = t & 7
 
-        sound_num, m = cls._parse_struct("<H" if flags & _SoundFlags.LARGESOUND else "<B", m)
-        pos, m = cls._parse_coords(m, protocol)
+        sound_num, pos = cls._parse_struct(_UINT16 if flags & _SOUND_FLAGS.LARGESOUND else _UINT8, m, pos)
+        sound_pos, pos = cls._parse_coords(m, pos, protocol)
+
+        return cls(volume, attenuation, entity_num, channel, sound_num, sound_pos), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        flags = m[pos]
 
-        return cls(volume, attenuation, entity_num, channel, sound_num, pos), m
+        if protocol.version == ProtocolVersion.NETQUAKE and flags & _SOUND_FLAGS.FITZQUAKE:
+            # Let the full parser raise the appropriate error.
+            return cls.parse(m, pos, protocol)[1]
+
+        return (pos + 1 +
+                (1 if flags & _SOUND_FLAGS.VOLUME else 0) +
+                (1 if flags & _SOUND_FLAGS.ATTENUATION else 0) +
+                (3 if flags & _SOUND_FLAGS.LARGEENTITY else 2) +
+                (2 if flags & _SOUND_FLAGS.LARGESOUND else 1) +
+                3 * cls._coord_size(protocol))
 
 
 @_register_server_message
@@ -1036,20 +1488,26 @@ class ServerMessageParticle(ServerMessage):
     field_names = ('origin', 'direction', 'count', 'color')
     msg_type = ServerMessageType.PARTICLE
 
+    _struct_direction = struct.Struct("<bbb")
+
     @classmethod
-    def parse(cls, m, protocol):
-        origin, m = cls._parse_coords(m, protocol)
-        
-        direction, m = cls._parse_struct("<bbb", m)
+    def parse(cls, m, pos, protocol):
+        origin, pos = cls._parse_coords(m, pos, protocol)
+
+        direction, pos = cls._parse_struct(cls._struct_direction, m, pos)
         direction = tuple(x / 16. for x in direction)
 
-        count, m = m[0], m[1:]
+        count, pos = m[pos], pos + 1
         if count == 255:
             count = 1024
 
-        color, m = m[0], m[1:]
+        color, pos = m[pos], pos + 1
 
-        return cls(origin, direction, count, color), m
+        return cls(origin, direction, count, color), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return pos + 3 * cls._coord_size(protocol) + 5
 
 
 @_register_server_message
@@ -1057,26 +1515,50 @@ class ServerMessageTempEntity(ServerMessage):
     field_names = ('temp_entity_type', 'entity_num', 'origin', 'end', 'color_start', 'color_length')
     msg_type = ServerMessageType.TEMP_ENTITY
 
-    @classmethod
-    def parse(cls, m, protocol):
-        temp_entity_type, m = TempEntityTypes(m[0]), m[1:]
+    temp_entity_type = _EnumField(TempEntityTypes)
+
+    _beam_types = frozenset(int(t) for t in (TempEntityTypes.LIGHTNING1, TempEntityTypes.LIGHTNING2,
+                                             TempEntityTypes.LIGHTNING3, TempEntityTypes.BEAM))
 
-        if temp_entity_type in (TempEntityTypes.LIGHTNING1, TempEntityTypes.LIGHTNING2, TempEntityTypes.LIGHTNING3,
-                                TempEntityTypes.BEAM):
-            (entity_num,), m = cls._parse_struct("<H", m)
-            origin, m = cls._parse_coords(m, protocol)
-            end, m = cls._parse_coords(m, protocol)
+    @classmethod
+    def parse(cls, m, pos, protocol):
+        temp_entity_type, pos = m[pos], pos + 1
+        if temp_entity_type > TempEntityTypes.BEAM:
+            # Raises the error for an unknown type.
+            TempEntityTypes(temp_entity_type)
+
+        if temp_entity_type in cls._beam_types:
+            (entity_num,), pos = cls._parse_struct(_UINT16, m, pos)
+            origin, pos = cls._parse_coords(m, pos, protocol)
+            end, pos = cls._parse_coords(m, pos, protocol)
         else:
-            origin, m = cls._parse_coords(m, protocol)
+            origin, pos = cls._parse_coords(m, pos, protocol)
             end = None
             entity_num = None
 
         if temp_entity_type == TempEntityTypes.EXPLOSION2:
-            color_start, color_length, m = m[0], m[1], m[2:]
+            color_start, color_length, pos = m[pos], m[pos + 1], pos + 2
         else:
             color_start, color_length = None, None
 
-        return cls(temp_entity_type, entity_num, origin, end, color_start, color_length), m
+        return cls(temp_entity_type, entity_num, origin, end, color_start, color_length), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        temp_entity_type = m[pos]
+
+        if temp_entity_type in cls._beam_types:
+            size = 2 + 6 * cls._coord_size(protocol)
+        elif temp_entity_type <= TempEntityTypes.BEAM:
+            size = 3 * cls._coord_size(protocol)
+        else:
+            # Let the full parser raise the appropriate error.
+            return cls.parse(m, pos, protocol)[1]
+
+        if temp_entity_type == TempEntityTypes.EXPLOSION2:
+            size += 2
+
+        return pos + 1 + size
 
 
 @_register_server_message
@@ -1095,9 +1577,13 @@ class ServerMessageFinale(ServerMessage):
     msg_type = ServerMessageType.FINALE
 
     @classmethod
-    def parse(cls, m, protocol):
-        s, m = cls._parse_string(m)
-        return cls(s), m
+    def parse(cls, m, pos, protocol):
+        s, pos = cls._parse_string(m, pos)
+        return cls(s), pos
+
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return cls._skip_string(m, pos)
 
 
 @_register_server_message
@@ -1111,34 +1597,164 @@ class ServerMessageDamage(ServerMessage):
     msg_type = ServerMessageType.DAMAGE
 
     @classmethod
-    def parse(cls, m, protocol):
-        armor, blood, m = m[0], m[1], m[2:]
-        origin, m = cls._parse_coords(m, protocol)
-        return cls(armor, blood, origin), m
+    def parse(cls, m, pos, protocol):
+        armor, blood, pos = m[pos], m[pos + 1], pos + 2
+        origin, pos = cls._parse_coords(m, pos, protocol)
+        return cls(armor, blood, origin), pos
 
+    @classmethod
+    def skip(cls, m, pos, protocol):
+        return pos + 2 + 3 * cls._coord_size(protocol)
 
-def read_demo_file(f):
+
+_DEMO_HEADER = struct.Struct("<Ifff")
+
+
+def _read_file_blocks(f):
+    """Yield `(buffer, start, end, view_angles)` for each block of a demo file object."""
     while _read(f, 1) != b'\n':
         pass
 
-    demo_header_fmt = "<Ifff"
-    demo_header_size = struct.calcsize(demo_header_fmt)
+    while True:
+        d = f.read(_DEMO_HEADER.size)
+        if len(d) == 0:
+            break
+        if len(d) < _DEMO_HEADER.size:
+            raise MalformedNetworkData
+        msg_len, *view_angles = _DEMO_HEADER.unpack(d)
+        yield _read(f, msg_len), 0, msg_len, view_angles
 
-    protocol = None
+
+def _read_growing(f, n, poll_interval, idle_timeout):
+    """Read `n` bytes from `f`, waiting for them to be written if the end is reached.
+
+    Fewer bytes are returned once the file has not grown for `idle_timeout`
+    seconds, or at once for pipes, whose reads only come up short when closed.
+    """
+    s = f.read(n)
+    if len(s) == n or not f.seekable():
+        return s
+
+    chunks = [s]
+    remaining = n - len(s)
+    idle = 0.0
+    while remaining and (idle_timeout is None or idle < idle_timeout):
+        time.sleep(poll_interval)
+        idle += poll_interval
+        s = f.read(remaining)
+        if s:
+            chunks.append(s)
+            remaining -= len(s)
+            idle = 0.0
+    return b''.join(chunks)
+
+
+def _follow_file_blocks(f, poll_interval, idle_timeout):
+    """Like `_read_file_blocks`, but waits for blocks still being written."""
+    def read(n):
+        s = _read_growing(f, n, poll_interval, idle_timeout)
+        if len(s) != n:
+            raise MalformedNetworkData
+        return s
+
+    while read(1) != b'\n':
+        pass
 
     while True:
-        d = f.read(demo_header_size)
+        d = _read_growing(f, _DEMO_HEADER.size, poll_interval, idle_timeout)
         if len(d) == 0:
             break
-        if len(d) < demo_header_size:
+        if len(d) < _DEMO_HEADER.size:
+            raise MalformedNetworkData
+        msg_len, *view_angles = _DEMO_HEADER.unpack(d)
+        yield read(msg_len), 0, msg_len, view_angles
+
+
+def _read_buffer_blocks(m):
+    """Like `_read_file_blocks` but locates the blocks within a buffer holding the whole demo."""
+    pos = m.find(b'\n')
+    if pos < 0:
+        raise MalformedNetworkData
+    pos += 1
+
+    size = len(m)
+    while pos < size:
+        if pos + _DEMO_HEADER.size > size:
+            raise MalformedNetworkData
+        msg_len, *view_angles = _DEMO_HEADER.unpack_from(m, pos)
+        pos += _DEMO_HEADER.size
+        if pos + msg_len > size:
             raise MalformedNetworkData
-        msg_len, *view_angles = struct.unpack(demo_header_fmt, d)
-        msg = _read(f, msg_len)
-        while msg:
-            parsed, msg = ServerMessage.parse_message(msg, protocol)
-            if parsed.msg_type == ServerMessageType.SERVERINFO: 
+        yield m, pos, pos + msg_len, view_angles
+        pos += msg_len
+
+
+def _parse_blocks(blocks, msg_types=None):
+    if msg_types is None:
+        wanted_classes = None
+    else:
+        wanted_classes = {cls for msg_type, cls in _MESSAGE_CLASSES.items() if msg_type in msg_types}
+        if ServerMessageType.UPDATE in msg_types:
+            wanted_classes.add(ServerMessageUpdate)
+
+    protocol = None
+
+    for m, pos, end, view_angles in blocks:
+        while pos < end:
+            msg_cls, pos = ServerMessage._lookup_message_class(m, pos, protocol)
+            wanted = wanted_classes is None or msg_cls in wanted_classes
+            if wanted or msg_cls.msg_type == ServerMessageType.SERVERINFO:
+                parsed, pos = msg_cls.parse(m, pos, protocol)
+            else:
+                pos = msg_cls.skip(m, pos, protocol)
+            if pos > end:
+                raise MalformedNetworkData('Message overruns the end of its block')
+            if msg_cls.msg_type == ServerMessageType.SERVERINFO:
                 protocol = parsed.protocol
-            yield not bool(msg), view_angles, parsed
+            if wanted:
+                yield pos == end, view_angles, parsed
+
+
+def read_demo_file(f, msg_types=None):
+    """Parse the demo in file object `f`, yielding `(msg_end, view_angles, msg)` for each message.
+
+    If `msg_types` is given, only messages whose `ServerMessageType` is in it are
+    yielded.  The remaining messages are skipped over without being decoded.
+    """
+    return _parse_blocks(_read_file_blocks(f), msg_types)
+
+
+def follow_demo_file(f, msg_types=None, poll_interval=0.1, idle_timeout=None):
+    """Like `read_demo_file`, but for a demo that is still being recorded.
+
+    Messages are yielded as soon as their block has been written.  At the end
+    of a file, it is polled every `poll_interval` seconds for more, until nothing
+    has been added for `idle_timeout` seconds (or forever if `None`).  A pipe is
+    read until it is closed.
+    """
+    return _parse_blocks(_follow_file_blocks(f, poll_interval, idle_timeout), msg_types)
+
+
+def read_demo_mmap(path, msg_types=None):
+    """Like `read_demo_file`, but maps the demo at `path` into memory and parses it in place.
+
+    Gzipped demos, and files that cannot be mapped such as pipes, are read with
+    `read_demo_file` instead.
+    """
+    if os.fspath(path).endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            yield from read_demo_file(f, msg_types)
+        return
+
+    with open(path, 'rb') as f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            yield from read_demo_file(f, msg_types)
+            return
+
+        with m:
+            yield from _parse_blocks(_read_buffer_blocks(m), msg_types)
 
 
 def clear_cache():
@@ -1150,6 +1766,26 @@ def clear_cache():
     ServerMessageUpdate.clear_cache()
 
 
+def cache_info():
+    """Return a `CacheInfo` with the hit, miss and eviction counts of the message cache.
+
+    `currsize` is the number of cached messages, and `maxsize` the bound set with
+    `set_cache_size`.
+    """
+    return ServerMessageUpdate._msg_cache.info()
+
+
+def set_cache_size(maxsize):
+    """Bound the message cache to `maxsize` entries, or leave it unbounded if `None`.
+
+    Least recently used messages are evicted once the bound is reached.  A larger
+    cache gives more hits on long demos at the cost of memory.
+    """
+    if maxsize is not None and maxsize < 0:
+        raise ValueError('maxsize must be non-negative or None')
+    ServerMessageUpdate._msg_cache.resize(maxsize)
+
+
 def demo_parser_main():
     def f():
         import sys
@@ -0,0 +1,132 @@
+"""On-disk cache of per-demo extractor results, keyed by a hash of the demo's contents.
+
+Each entry is a directory holding the files an extractor wrote for one demo,
+under their paths relative to the output directory.  Entries are found by
+path, so a lookup is a single `stat`, and the least recently used ones are
+evicted once the cache grows beyond its size bound.
+"""
+
+__all__ = (
+    'ResultCache',
+    'hash_file',
+    'hash_files',
+)
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+_CHUNK_SIZE = 1 << 20
+
+
+def hash_file(path, h=None):
+    """Return a blake2b hash of the contents of `path`, updating `h` if given."""
+    if h is None:
+        h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fd:
+        while True:
+            chunk = fd.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h
+
+
+def hash_files(paths):
+    """Return a hex digest covering the names and contents of `paths`, for versioning results."""
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        h.update(os.path.basename(path).encode() + b"\0")
+        hash_file(path, h)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, demo_path, version, name=""):
+        """Return the cache key for the demo at `demo_path`, processed by an extractor at `version`.
+
+        Entries hold files named after the demo, so `name`, the name its
+        results are written under, is part of the key too.
+        """
+        h = hash_file(demo_path)
+        h.update(b"\0" + version.encode() + b"\0" + name.encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, output_dir):
+        """Copy the files cached under `key` into `output_dir`, returning their paths, or `None` on a miss."""
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return None
+
+        outputs = []
+        for root, _, files in os.walk(entry):
+            for name in files:
+                src = os.path.join(root, name)
+                dst = os.path.join(output_dir, os.path.relpath(src, entry))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(src, dst)
+                outputs.append(dst)
+
+        # Mark the entry as recently used, for eviction.
+        os.utime(entry)
+        return sorted(outputs)
+
+    def put(self, key, output_dir, outputs):
+        """Cache the files `outputs`, which lie within `output_dir`, under `key`."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            for path in outputs:
+                dst = os.path.join(tmp, os.path.relpath(path, output_dir))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(path, dst)
+
+            entry = self._entry(key)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # Replace the existing entry, as when results are recomputed with --force.
+                shutil.rmtree(entry, ignore_errors=True)
+                try:
+                    os.rename(tmp, entry)
+                except OSError:
+                    # Another worker stored the same result in between.
+                    pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is within its size bound.
+
+        Returns the number of entries removed.
+        """
+        entries = []
+        total = 0
+        for prefix in os.scandir(self.directory) if os.path.isdir(self.directory) else ():
+            if not prefix.is_dir() or prefix.name.startswith("."):
+                continue
+            for entry in os.scandir(prefix.path):
+                size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, files in os.walk(entry.path) for name in files)
+                entries.append((entry.stat().st_mtime, size, entry.path))
+                total += size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
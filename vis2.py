@@ -1,66 +1,263 @@
 #!/usr/bin/env python
-import pandas as pd
+"""Derive extra.json for a demo from the frags.json and items.json written by mvdparser.
+
+extra.json holds the swing of the team score over time, and the quads, pents
+and flag captures.  Two engines compute it with identical results: `numpy`,
+the default, and `pandas`, whose import alone takes about a second.
+`extra_columns` takes the events as arrays by field instead of records, as
+demstats keeps them.
+"""
+import argparse
 import json
 import sys
 
-players = set([])
+import numpy as np
 
-result = {
-    "frags": [],
-    "events": []
-}
 
-demo = sys.argv[1]
+def load(demo):
+    with open(f"{demo}.frags.json") as fd:
+        frags = json.load(fd)[:-1] # [:-1] due to hacky stats generator
+
+    with open(f"{demo}.items.json") as fd:
+        items = json.load(fd)[:-1] # [:-1] due to hacky stats generator
+
+    return frags, items
+
+
+def extra_pandas(frags, items):
+    import pandas as pd
+
+    result = {
+        "frags": [],
+        "events": []
+    }
+
+    result["players"] = list(set((event["player_id"], event["team"], event["name"]) for event in frags))
+
+    frags_df = pd.DataFrame(frags)
+
+    deaths_df = frags_df[["timestamp", "player_id", "deaths"]].copy()
+    deaths_df.drop_duplicates(subset=["player_id", "deaths"], inplace=True)
+
+    frags_df = frags_df.pivot_table(index=["timestamp"], columns=["team", "player_id"], values=["frags", "deaths"]).ffill()
+
+    teamscore = frags_df["frags"].groupby(axis=1, level=0).sum()
+    teamscore["delta"] = teamscore["red"] - teamscore["blue"]
+
+    max_delta = max(abs(teamscore["delta"].min()), teamscore["delta"].max())
+    teamscore["delta_scaled"] = teamscore["delta"] / max_delta
+
+    result["frags"] = list(zip(teamscore.index.tolist(), teamscore["delta_scaled"].round(4).tolist()))
+
+
+    items_df = pd.DataFrame(items)
+    by_type = items_df.melt(id_vars=["timestamp", "player_id"])
+    by_type["delta"] = by_type.groupby(["player_id", "variable"])["value"].diff()
+    events = by_type[by_type["delta"] > 0].sort_values(by=["timestamp"])
+
+    # Per event: the percentage of the quad used before dying, or the time the
+    # captured flag was taken.
+    extra = {}
+
+    quads = events[events["variable"] == "quad"]
+    if len(quads):
+        # The first death of the quad holder at or after the pickup, if within the 30 seconds.
+        deaths = deaths_df[["timestamp", "player_id"]].rename(columns={"timestamp": "death"})
+        deaths = deaths.astype({"death": "float64"}).sort_values(by=["death"], kind="stable")
+        quad_deaths = pd.merge_asof(quads[["timestamp", "player_id"]].astype({"timestamp": "float64"}), deaths,
+                                    left_on="timestamp", right_on="death", by="player_id", direction="forward")
+        timestamp = quad_deaths["timestamp"].to_numpy()
+        death = quad_deaths["death"].to_numpy()
+        died = death <= timestamp + 30
+        quad_time = np.where(died, (death - timestamp) / 30, 1.0)
+        extra.update(zip(quads.index, np.round(quad_time * 100.0, 0)))
+
+    captures = events[events["variable"] == "flagcap"]
+    if len(captures):
+        # The last take of the flag by the capturing player before the capture.
+        takes = events[events["variable"] == "flagtk"][["timestamp", "player_id"]].rename(columns={"timestamp": "take"})
+        flag_takes = pd.merge_asof(captures[["timestamp", "player_id"]].astype({"timestamp": "float64"}),
+                                   takes.astype({"take": "float64"}), left_on="timestamp", right_on="take",
+                                   by="player_id", direction="backward", allow_exact_matches=False)
+        for i, take in zip(captures.index, flag_takes["take"].to_numpy()):
+            extra[i] = None if np.isnan(take) else take
+
+    event_names = {"quad": "quad", "pent": "pent", "flagcap": "capture"}
+    shown = events[events["variable"].isin(event_names)]
+    result["events"] = list(zip(
+        shown["timestamp"].tolist(),
+        shown["player_id"].tolist(),
+        shown["variable"].map(event_names).tolist(),
+        shown["value"].tolist(),
+        [extra.get(i) for i in shown.index],
+    ))
+
+    return result
 
-with open(f"{demo}.frags.json") as fd:
-    frags = json.load(fd)[:-1] # [:-1] due to hacky stats generator
 
-with open(f"{demo}.items.json") as fd:
-    items = json.load(fd)[:-1] # [:-1] due to hacky stats generator
+def frag_columns(frags):
+    """Return the frag records `frags` as arrays by field, for `extra_columns`."""
+    return {
+        "timestamp": np.array([event["timestamp"] for event in frags]),
+        "player_id": np.array([event["player_id"] for event in frags]),
+        "name": np.array([event["name"] for event in frags], dtype=object),
+        "team": np.array([event["team"] for event in frags], dtype=object),
+        "frags": np.array([event["frags"] for event in frags]),
+        "deaths": np.array([event["deaths"] for event in frags]),
+    }
 
-result["players"] = list(set((event["player_id"], event["team"], event["name"]) for event in frags))
 
-frags_df = pd.DataFrame(frags)
+def item_columns(items):
+    """Return the item records `items` as arrays by field, in the order the fields first appear."""
+    return {key: np.array([item[key] for item in items]) for key in dict.fromkeys(key for item in items for key in item)}
 
-deaths_df = frags_df[["timestamp", "player_id", "deaths"]].copy()
-deaths_df.drop_duplicates(subset=["player_id", "deaths"], inplace=True)
 
-frags_df = frags_df.pivot_table(index=["timestamp"], columns=["team", "player_id"], values=["frags", "deaths"]).ffill()
+def _pair_keys(a, b):
+    """Combine the non-negative integer arrays `a` and `b` into one key per pair, ordered like the pairs."""
+    return a.astype(np.int64) * (int(b.max(initial=0)) + 1) + b
 
-teamscore = frags_df["frags"].groupby(axis=1, level=0).sum()
-teamscore["delta"] = teamscore["red"] - teamscore["blue"]
 
-max_delta = max(abs(teamscore["delta"].min()), teamscore["delta"].max())
-teamscore["delta_scaled"] = teamscore["delta"] / max_delta
+def extra_numpy(frags, items):
+    return extra_columns(frag_columns(frags), item_columns(items))
+
+
+def extra_columns(frags, items):
+    """Compute extra.json from frag and item events given as arrays by field.
+
+    `frags` has the `timestamp`, `player_id`, `name`, `team`, `frags` and
+    `deaths` of each frag event, and `items` the `timestamp` and `player_id`
+    of each item event followed by one array per item counter.
+    """
+    result = {
+        "frags": [],
+        "events": []
+    }
+
+    player_ids = frags["player_id"]
+    result["players"] = list(set(zip(player_ids.tolist(), frags["team"].tolist(), frags["name"].tolist())))
+
+    # Team score swing: each player's frags, averaged over their entries at the
+    # same time and carried forward, summed per team.
+    times, rows = np.unique(frags["timestamp"], return_inverse=True)
+    frag_counts = frags["frags"].astype(np.float64)
+    team_list = frags["team"].tolist()
+    team_names = sorted(set(team_list))
+    team_index = {team: i for i, team in enumerate(team_names)}
+    team_codes = np.array([team_index[team] for team in team_list], dtype=np.int64)
+    column_keys, column_index = np.unique(_pair_keys(team_codes, player_ids), return_inverse=True)
+    cells = column_index * len(times) + rows
+
+    shape = (len(column_keys), len(times))
+    count = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+    total = np.bincount(cells, weights=frag_counts, minlength=shape[0] * shape[1]).reshape(shape)
+    with np.errstate(invalid="ignore"):
+        mean = total / count
+    filled = np.maximum.accumulate(np.where(count > 0, np.arange(len(times)), 0), axis=1)
+    mean = np.take_along_axis(mean, filled, axis=1)
+    mean[np.isnan(mean)] = 0.0
+
+    teams = {}
+    column_teams = column_keys // (int(player_ids.max(initial=0)) + 1)
+    for team_code, score in zip(column_teams.tolist(), mean):
+        team = team_names[team_code]
+        if team in teams:
+            teams[team] = teams[team] + score
+        else:
+            teams[team] = score
+
+    delta = teams["red"] - teams["blue"]
+    max_delta = max(abs(delta.min()), delta.max())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_scaled = delta / max_delta
+    result["frags"] = list(zip(times.tolist(), np.round(delta_scaled, 4).tolist()))
+
+    # Item events: every increase of a player's item counters, ordered by time.
+    item_times = items.get("timestamp", np.zeros(0))
+    item_players = items.get("player_id", np.zeros(0, dtype=np.intp))
+    variables = [key for key in items if key not in ("timestamp", "player_id")]
+    by_player = np.argsort(item_players, kind="stable")
+    same_player = item_players[by_player[1:]] == item_players[by_player[:-1]]
+
+    event_rows = []
+    event_variables = []
+    for variable in variables:
+        values = items[variable]
+        increased = np.zeros(len(item_times), dtype=bool)
+        increased[by_player[1:]] = same_player & (values[by_player[1:]] > values[by_player[:-1]])
+        changed = np.flatnonzero(increased)
+        event_rows.append(changed)
+        event_variables.extend([variable] * len(changed))
+
+    event_rows = np.concatenate(event_rows) if event_rows else np.zeros(0, dtype=np.intp)
+    # Same sort as pandas' sort_values, so events at the same time keep its order.
+    order = np.argsort(item_times[event_rows], kind="quicksort")
+    event_rows = event_rows[order]
+    event_variables = [event_variables[i] for i in order]
+    event_times = item_times[event_rows]
+    event_players = item_players[event_rows]
+
+    # Times of each player's deaths, and of their flag takes.
+    _, first = np.unique(_pair_keys(player_ids, frags["deaths"]), return_index=True)
+    death_players = player_ids[first]
+    death_times = frags["timestamp"][first].astype(np.float64)
+    deaths = {player_id: np.sort(death_times[death_players == player_id], kind="stable")
+              for player_id in np.unique(death_players).tolist()}
+
+    takes = {}
+    for variable, timestamp, player_id in zip(event_variables, event_times, event_players):
+        if variable == "flagtk":
+            takes.setdefault(player_id, []).append(timestamp)
+    takes = {player_id: np.array(times) for player_id, times in takes.items()}
+
+    event_names = {"quad": "quad", "pent": "pent", "flagcap": "capture"}
+    for row, variable, timestamp, player_id in zip(event_rows.tolist(), event_variables, event_times.tolist(),
+                                                   event_players.tolist()):
+        if variable not in event_names:
+            continue
+
+        extra = None
+        if variable == "quad":
+            # The first death at or after the pickup, if within the 30 seconds.
+            quad_time = 1.0
+            player_deaths = deaths.get(player_id, ())
+            i = np.searchsorted(player_deaths, timestamp) if len(player_deaths) else 0
+            if i < len(player_deaths) and player_deaths[i] <= timestamp + 30:
+                quad_time = (player_deaths[i] - timestamp) / 30
+            extra = round(quad_time * 100.0, 0)
+        elif variable == "flagcap":
+            # The last take of the flag before the capture.
+            player_takes = takes.get(player_id, ())
+            i = np.searchsorted(player_takes, timestamp) if len(player_takes) else 0
+            if i > 0:
+                extra = player_takes[i - 1]
+
+        result["events"].append((timestamp, player_id, event_names[variable], items[variable][row].item(), extra))
+
+    return result
+
+
+ENGINES = {
+    "numpy": extra_numpy,
+    "pandas": extra_pandas,
+}
+
 
-for timestamp, event in teamscore.iterrows():
-    result["frags"].append((timestamp, round(event["delta_scaled"], 4)))
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("demo", help="demo basename, reading <demo>.frags.json and <demo>.items.json")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="numpy", help="implementation to use")
+    args = parser.parse_args()
 
+    frags, items = load(args.demo)
+    result = ENGINES[args.engine](frags, items)
 
-items_df = pd.DataFrame(items)
-by_type = items_df.melt(id_vars=["timestamp", "player_id"])
-by_type["delta"] = by_type.groupby(["player_id", "variable"])["value"].diff()
-events = by_type[by_type["delta"] > 0].sort_values(by=["timestamp"])
+    basename = args.demo
+    if basename.endswith(".mvd"):
+        basename = basename[:-len(".mvd")]
 
-for idx, event in events.iterrows():
-    if event.variable == "quad":
-        filter_player = (deaths_df["player_id"] == event.player_id)
-        filter_quad_time = (deaths_df["timestamp"].between(event.timestamp, event.timestamp + 30))
-        quad_death = deaths_df[filter_player & filter_quad_time][:1]
-        quad_time = 1.0
-        if quad_death.size > 0:
-            quad_time = (quad_death["timestamp"].values[0] - event.timestamp) / 30
-        result["events"].append((event["timestamp"], event["player_id"], "quad", event["value"], round(quad_time * 100.0, 0)))
-    elif event.variable == "pent":
-        result["events"].append((event["timestamp"], event["player_id"], "pent", event["value"], None))
-    elif event.variable == "flagcap":
-        filter_player = (events["player_id"] == event.player_id)
-        filter_take = (events["variable"] == "flagtk")
-        filter_take_time = (events["timestamp"] < event.timestamp)
-        flag_take = events[filter_player & filter_take & filter_take_time][-1:]
-        result["events"].append((event["timestamp"], event["player_id"], "capture", event["value"], flag_take["timestamp"].values[0]))
+    with open(f"{basename}.extra.json", "w") as fd:
+        json.dump(result, fd)
 
-basename = demo.rstrip(".mvd")
 
-with open(f"{basename}.extra.json", "w") as fd:
-    json.dump(result, fd)
+if __name__ == "__main__":
+    main()